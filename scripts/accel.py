@@ -0,0 +1,108 @@
+import numpy as np
+from typing import Tuple
+
+from batch import PacketBatch
+
+class AccelDetector():
+    """
+    Host-side motion detection from the acceleration in every frame, as an
+    alternative or addition to the MPU's motion interrupt bits.
+
+    The last `history` samples of every channel are kept in ring buffers
+    shared by all channels, one row per channel id, and a whole read is
+    worked on at once, so the cost follows the number of frames and not the
+    number of channels. Per frame:
+
+    magnitude  |acc| in g
+    jerk       change per s of each axis (g/s), which is the high-pass
+    energy     mean square over the last `window` frames of the magnitude
+               minus its mean over the `baseline` frames before (gravity,
+               posture), in g^2
+
+    Axes with a jerk over `jerk` either way while the energy is over
+    `energy` fire, as bits laid out like Packet.motion_bits.
+    """
+    lsb_per_g = 16384 # +-2 g, what mpu.initialize() leaves it at
+    history = 64
+    window = 4
+    baseline = 16
+
+    # Motion bits for x, y and z, Packet.motion_keys runs z, y, x from bit 2
+    pos_bits = np.array([1 << 6, 1 << 4, 1 << 2], np.uint8)
+    neg_bits = pos_bits << 1
+
+    def __init__(self, jerk: float, energy: float):
+        self.configure(jerk, energy)
+        # NaN until written, features of a channel's first frames come out NaN and never fire
+        self.acc = np.full((256, self.history, 3), np.nan, np.float32)
+        self.time = np.zeros((256, self.history), np.int64)
+        self.count = np.zeros(256, np.int64) # Samples so far per channel
+        empty = np.empty(0, np.float32)
+        self.magnitude, self.jerk_g, self.energy_g = empty, np.empty((0, 3), np.float32), empty
+
+    def configure(self, jerk: float, energy: float):
+        self.jerk = jerk
+        self.energy = energy
+
+    def process(self, frames) -> np.ndarray:
+        """
+        Motion bits for each of `frames`, a PacketBatch.frames array or raw
+        frame bytes. The features stay in magnitude, jerk_g and energy_g.
+        """
+        if not isinstance(frames, np.ndarray):
+            frames = np.frombuffer(frames, PacketBatch.dtype)
+        n = len(frames)
+        if n == 0:
+            return np.zeros(0, np.uint8)
+
+        # Grouped by channel, in arrival order within a channel
+        ids = frames["id"].astype(np.int64)
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        first = np.ones(n, bool)
+        first[1:] = ids[1:] != ids[:-1]
+        starts = np.flatnonzero(first)
+        rank = np.arange(n) - np.repeat(starts, np.diff(np.append(starts, n)))
+
+        # A channel may only go so far round its ring in one go, or older frames would see newer ones
+        frames = frames[order]
+        limit = self.history - self.baseline - self.window
+        if rank.max() < limit:
+            features = self.features(frames, ids, rank)
+        else:
+            features = (np.empty(n, np.float32), np.empty((n, 3), np.float32), np.empty(n, np.float32))
+            for lo in range(0, int(rank.max()) + 1, limit):
+                part = (rank >= lo) & (rank < lo + limit)
+                for f, f_part in zip(features, self.features(frames[part], ids[part], rank[part] - lo)):
+                    f[part] = f_part
+
+        # Back in frame order
+        magnitude, jerk, energy = (np.empty_like(f) for f in features)
+        magnitude[order], jerk[order], energy[order] = features
+        self.magnitude, self.jerk_g, self.energy_g = magnitude, jerk, energy
+
+        fire = (energy > self.energy)[:, None]
+        up = (jerk > self.jerk) & fire
+        down = (jerk < -self.jerk) & fire
+        return (up * self.pos_bits).sum(axis=1, dtype=np.uint8) | (down * self.neg_bits).sum(axis=1, dtype=np.uint8)
+
+    def features(self, frames: np.ndarray, ids: np.ndarray, rank: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Magnitude, jerk and energy of frames grouped by channel, `rank` is their place in the group"""
+        history = self.history
+        count = self.count[ids] + rank
+        slot = count % history
+        self.acc[ids, slot] = frames["acc"] / np.float32(self.lsb_per_g)
+        self.time[ids, slot] = frames["sensor_time"]
+        np.add.at(self.count, ids, 1)
+
+        # This frame and the ones before it, newest first
+        back = (count[:, None] - np.arange(self.window + self.baseline)) % history
+        acc = self.acc[ids[:, None], back]
+        magnitude = np.sqrt((acc * acc).sum(axis=2))
+        high = magnitude[:, :self.window] - magnitude[:, self.window:].mean(axis=1, keepdims=True)
+        energy = (high * high).mean(axis=1)
+
+        # millis() wraps, same-ms frames count as 1 ms apart
+        dt = (self.time[ids, slot] - self.time[ids, back[:, 1]]) & 0xffffffff
+        jerk = (acc[:, 0] - acc[:, 1]) / (np.maximum(dt, 1) / np.float32(1000))[:, None]
+        return magnitude[:, 0], jerk.astype(np.float32), energy.astype(np.float32)
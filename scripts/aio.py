@@ -0,0 +1,174 @@
+import asyncio
+import sys, traceback
+import threading
+from typing import Callable
+
+from interface import SensorInterface
+from osc_client import OscClient
+from latency import LatencyMonitor
+from packet import Config as PacketConfig
+
+class AsyncCore():
+    """
+    One asyncio event loop in one background thread, shared by the serial
+    interface and the OSC client instead of a blocked QThreadPool thread each.
+
+    Workers are started with start(worker) and stopped with worker.stop(),
+    which takes effect on the next loop iteration instead of waiting for a
+    read to be cancelled or a queue poll to time out.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, name="AsyncCore", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def call(self, fn: Callable, *args):
+        """Run fn in the loop thread, directly when already there"""
+        if threading.current_thread() is self.thread:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def start(self, worker: "AsyncSensorInterface | AsyncOscClient"):
+        worker.core = self
+        self.call(worker.start_async)
+
+    def close(self):
+        # Queued behind any stop() already requested
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1)
+
+class AsyncWorker():
+    core : AsyncCore = None
+    done = False
+
+    def fail(self):
+        traceback.print_exc()
+        exctype, value = sys.exc_info()[:2]
+        self.signals.error.emit((exctype, value, traceback.format_exc()))
+        self.finish()
+
+    def stop(self):
+        self.running = False
+        self.core.call(self.finish)
+
+class AsyncSensorInterface(AsyncWorker, SensorInterface):
+    """SensorInterface reading the port when its file descriptor is readable"""
+    def start_async(self):
+        try:
+            self.running = True
+            self.open(timeout=0)
+            self.core.loop.add_reader(self.port.fileno(), self.readable)
+        except:
+            self.fail()
+
+    retry_timer = None
+
+    def readable(self):
+        try:
+            self.poll()
+            self.write_configs()
+        except:
+            self.fail()
+
+    def update_config(self, config: PacketConfig):
+        # Written right away instead of after the next received frame
+        self.core.call(self.write_config, config)
+
+    def write_config(self, config: PacketConfig):
+        if self.running:
+            self.downlink.put(config)
+            # Once the burst of updates is in, one write for all of them
+            self.schedule_write(0)
+
+    def write_configs(self):
+        super().write_configs()
+        wait = self.downlink.wait_time()
+        if wait is not None:
+            self.schedule_write(max(wait, .01))
+
+    def schedule_write(self, delay: float):
+        when = self.core.loop.time() + delay
+        if self.retry_timer is not None:
+            if self.retry_timer.when() <= when:
+                return
+            self.retry_timer.cancel()
+        self.retry_timer = self.core.loop.call_at(when, self.retry)
+
+    def retry(self):
+        self.retry_timer = None
+        try:
+            if self.running:
+                self.write_configs()
+        except:
+            self.fail()
+
+    def finish(self):
+        if self.done:
+            return
+        self.done = True
+        if self.retry_timer is not None:
+            self.retry_timer.cancel()
+            self.retry_timer = None
+        if getattr(self, "port", None) is not None and self.port.is_open:
+            self.core.loop.remove_reader(self.port.fileno())
+            self.port.close()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+        self.running = False
+        self.signals.finished.emit()
+
+class AsyncOscClient(AsyncWorker, OscClient):
+    """OscClient sending from the loop, bundle windows and deferred cues are loop timers"""
+    def start_async(self):
+        self.pending = []
+        self.flush_timer = None
+        try:
+            self.running = True
+            self.open()
+        except:
+            self.fail()
+
+    def send_cue(self, cue: str, host_time: float = None, trace: tuple = None):
+        if trace is not None:
+            trace += (LatencyMonitor.now(),)
+        self.core.call(self.queue_cue, (cue, host_time, trace))
+
+    def queue_cue(self, item: tuple):
+        if not self.running:
+            return
+        self.pending.append(item)
+        if self.bundle_window <= 0:
+            self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = self.core.loop.call_later(self.bundle_window, self.flush)
+
+    def flush(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        items, self.pending = self.pending, []
+        try:
+            self.dispatch(items)
+        except:
+            self.fail()
+            return
+        wait = self.governor.wait_time()
+        if wait is not None:
+            self.flush_timer = self.core.loop.call_later(wait, self.flush)
+
+    def finish(self):
+        if self.done:
+            return
+        self.done = True
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        self.close()
+        self.running = False
+        self.signals.finished.emit()
@@ -0,0 +1,65 @@
+import numpy as np
+from time import time
+from typing import Iterator, List
+
+from packet import Packet
+
+class PacketBatch():
+    """
+    Columnar form of many packets: a numpy structured array over the packet_t
+    frame layout (including magic and checksum), plus the host time at which
+    the batch was decoded.
+    """
+    dtype = np.dtype([("magic",            "<u2"),
+                      ("id",               "u1"),
+                      ("sensor_time",      "<u4"),
+                      ("motion_time",      "<u4"),
+                      ("acc",              "<i2", (3,)),
+                      ("motion",           "u1"),
+                      ("cfg_update",       "u1"),
+                      ("threshold",        "u1"),
+                      ("duration",         "u1"),
+                      ("checksum",         "u1")])
+    assert dtype.itemsize == Packet.size
+
+    __slots__ = ("frames", "host_time")
+
+    def __init__(self, frames: np.ndarray, host_time: float = None):
+        self.frames = frames
+        self.host_time = time() if host_time is None else host_time
+
+    @classmethod
+    def from_buffer(cls, buf) -> "PacketBatch":
+        """Copies the frames in `buf`, so the buffer can be reused"""
+        return cls(np.frombuffer(buf, dtype=cls.dtype).copy())
+
+    @classmethod
+    def concatenate(cls, batches: List["PacketBatch"]) -> "PacketBatch":
+        if len(batches) == 1:
+            return batches[0]
+        return cls(np.concatenate([b.frames for b in batches]) if batches else np.empty(0, cls.dtype))
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __getitem__(self, i: int) -> Packet:
+        f = self.frames[i]
+        packet = Packet(int(f["id"]), int(f["sensor_time"]),
+                        int(f["cfg_update"]), int(f["threshold"]), int(f["duration"]),
+                        int(f["motion"]), int(f["motion_time"]),
+                        tuple(int(v) for v in f["acc"]))
+        packet.host_time = self.host_time
+        return packet
+
+    def __iter__(self) -> Iterator[Packet]:
+        for i in range(len(self.frames)):
+            yield self[i]
+
+    def valid(self) -> np.ndarray:
+        """Mask of frames with a correct magic and checksum"""
+        raw = self.frames.view(np.uint8).reshape(len(self.frames), Packet.size)
+        return (self.frames["magic"] == 0xE1BA) & (raw[:, 2:-1].sum(axis=1, dtype=np.uint8) == self.frames["checksum"])
+
+    def motion(self, axes_mask: int = 0xff) -> np.ndarray:
+        """Mask of frames with motion on any of the axes in `axes_mask`"""
+        return (self.frames["motion"] & axes_mask) != 0
@@ -0,0 +1,759 @@
+#!/usr/bin/env python3
+"""
+Micro benchmarks for the host side of the footstep tracker.
+
+Run from the scripts folder, e.g. `./bench.py decoder`.
+"""
+import argparse
+import io
+import random
+from time import perf_counter, sleep, time
+
+from packet import Packet, FrameDecoder, Config as PacketConfig
+from batch import PacketBatch
+
+def capture(count: int, channels: int = 18) -> bytes:
+    """Synthetic capture of `count` frames spread over `channels` channels"""
+    packets = []
+    for i in range(count):
+        ch = i % channels + 1
+        motion = Packet.motion_mask([random.random() < .05 for _ in Packet.motion_keys])
+        packets.append(Packet(ch, i * 10, False, 35, 5, motion, i * 10,
+                              tuple(random.randint(-2000, 2000) for _ in range(3))))
+    return b"".join(p.bytes() for p in packets)
+
+class ReplayPort():
+    """Stand-in for serial.Serial replaying a capture in chunks of `chunk` bytes"""
+    def __init__(self, data: bytes, chunk: int):
+        self.stream = io.BytesIO(data)
+        self.remaining = len(data)
+        self.chunk = chunk
+
+    @property
+    def in_waiting(self) -> int:
+        return min(self.chunk, self.remaining)
+
+    def read(self, size: int) -> bytes:
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        n = self.stream.readinto(b)
+        self.remaining -= n
+        return n
+
+def report(name: str, count: int, elapsed: float):
+    print(f"{name:>24s}: {count / elapsed:12.0f} frames/s ({elapsed * 1e6 / count:6.2f} us/frame)")
+
+def bench_decoder(args):
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            data = f.read()
+    else:
+        data = capture(args.frames)
+    frames = len(data) // Packet.size
+
+    port = ReplayPort(data, args.chunk)
+    start = perf_counter()
+    count = 0
+    while port.remaining:
+        if Packet.from_bytes(port.read(Packet.size)) is not None:
+            count += 1
+    report("per-packet read", count, perf_counter() - start)
+
+    port = ReplayPort(data, args.chunk)
+    decoder = FrameDecoder()
+    start = perf_counter()
+    count = 0
+    while port.remaining:
+        decoder.readinto(port)
+        count += len(decoder.decode())
+    report(f"FrameDecoder ({args.chunk}B)", count, perf_counter() - start)
+
+    assert count == frames, f"decoded {count} of {frames} frames"
+
+def qt_app():
+    """Offscreen QApplication so widget benchmarks run without a display"""
+    import os
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+def tracker_config(channels: int):
+    import config
+    cfg = config.Config()
+    cfg.trackers = [config.TrackerConfig(channels=[2*i+1, 2*i+2],
+                                         threshold=[35] * 2,
+                                         duration=[5] * 2,
+                                         axes=[[True] * 6, [True] * 6],
+                                         cue=f"/cue/{(i+1)*10}/start",
+                                         repeat_different=500,
+                                         repeat_same=500) for i in range((channels + 1) // 2)]
+    return cfg
+
+def bench_table(args):
+    app = qt_app()
+    from tracker import TrackerTable
+    from engine import ChannelState, FilterEngine
+    cfg = tracker_config(args.channels)
+    engine = FilterEngine(cfg)
+    table = TrackerTable(cfg, engine)
+    data = capture(args.frames, args.channels)
+    decoder = FrameDecoder()
+    decoder.feed(data)
+    packets = decoder.decode()
+
+    motion_times = {}
+    def legacy_process(packet: Packet):
+        """Every filter and every row per packet, GUI updated per packet"""
+        for f in engine.filters:
+            if packet.id not in f.config.channels:
+                continue
+            f.process(packet, f.config.channels.index(packet.id))
+        for row in range(table.rowCount()):
+            if table.cellWidget(row, 1).value() == packet.id:
+                state = ChannelState()
+                state.packet = packet
+                if motion_times.get(packet.id) != packet.motion_time:
+                    motion_times[packet.id] = packet.motion_time
+                    state.motion = packet.motion_bits
+                table.updateRowChannelInfo(row, state)
+
+    def routed_process(packet: Packet):
+        engine.process(packet)
+
+    for name, process in [("scan all filters + rows", legacy_process),
+                          ("routing + snapshot", routed_process)]:
+        start = perf_counter()
+        for packet in packets:
+            process(packet)
+        table.refresh()
+        elapsed = perf_counter() - start
+        app.processEvents()
+        print(f"{name:>24s}: {len(packets) / elapsed:12.0f} packets/s with {args.channels} channels")
+
+def bench_flash(args):
+    app = qt_app()
+    from tracker import TrackerTable, Columns, FLASH_TIMEOUT
+    from engine import FilterEngine
+    from PyQt6.QtCore import QTimer
+    cfg = tracker_config(args.channels)
+    table = TrackerTable(cfg, FilterEngine(cfg))
+    table.show()
+    widgets = [table.cellWidget(row, column) for row in range(table.rowCount()) for column in Columns.AXES]
+    sequence = [random.choice(widgets) for _ in range(args.flashes)]
+
+    timers = {}
+    def legacy_flash(widget):
+        """QTimer and stylesheet per flash"""
+        if widget in timers:
+            timers[widget][0].stop()
+            stylesheet = timers[widget][1]
+        else:
+            stylesheet = widget.styleSheet()
+        timer = QTimer()
+        timer.setInterval(FLASH_TIMEOUT)
+        timer.setSingleShot(True)
+        timer.timeout.connect(lambda: legacy_restore(widget))
+        timer.start()
+        timers[widget] = (timer, stylesheet)
+        widget.setStyleSheet(stylesheet + "background-color:red;")
+
+    def legacy_restore(widget):
+        widget.setStyleSheet(timers[widget][1])
+        del timers[widget]
+
+    for name, flash in [("QTimer per flash", legacy_flash),
+                        ("FlashScheduler", table.flash)]:
+        start = perf_counter()
+        for i, widget in enumerate(sequence):
+            flash(widget)
+            if i % args.batch == 0:
+                app.processEvents()
+        elapsed = perf_counter() - start
+        print(f"{name:>24s}: {len(sequence) / elapsed:12.0f} flashes/s")
+
+        # Let everything expire before the next run
+        end = perf_counter() + 2 * FLASH_TIMEOUT / 1000
+        while perf_counter() < end:
+            app.processEvents()
+
+class LegacyPacket():
+    """Packet as it was before __slots__: a __dict__, a motion list and an acc tuple"""
+    def __init__(self, id, sensor_time, cfg_update, threshold, duration, motion, motion_time, acc):
+        self.host_time = time()
+        self.id = id
+        self.cfg_update = cfg_update
+        self.threshold = threshold
+        self.duration = duration
+        self.sensor_time = sensor_time
+        self.motion = motion
+        self.motion_time = motion_time
+        self.acc = acc
+
+    @classmethod
+    def from_fields(cls, fields):
+        (magic, id, sensor_time, time_last_motion, acc_x, acc_y, acc_z,
+         motion_status, cfg_update, cfg_threshold, cfg_duration, checksum) = fields
+        return cls(id, sensor_time, cfg_update, cfg_threshold, cfg_duration,
+                   [(motion_status & (1 << i) != 0) for i in range(8)][2:],
+                   time_last_motion, (acc_x, acc_y, acc_z))
+
+def bench_packet(args):
+    import struct
+    import tracemalloc
+    data = capture(args.rate)
+    fields = list(struct.iter_unpack(Packet.format, data))
+
+    def measure(name, build):
+        start = perf_counter()
+        for _ in range(args.repeat):
+            build()
+        elapsed = (perf_counter() - start) / args.repeat
+
+        tracemalloc.start()
+        result = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        print(f"{name:>24s}: {args.rate / elapsed:12.0f} packets/s, "
+              f"{elapsed * 100:5.1f}% of a core and {size / 1024:7.0f} KiB per second of traffic")
+
+    print(f"{args.rate} packets/s:")
+    measure("legacy Packet", lambda: [LegacyPacket.from_fields(f) for f in fields])
+    measure("__slots__ Packet", lambda: [Packet.from_fields(f) for f in fields])
+    measure("PacketBatch", lambda: PacketBatch.from_buffer(data))
+
+def bench_pipeline(args):
+    import tempfile
+    from pathlib import Path
+    from engine import FilterEngine
+    from interface import SensorInterface
+    from recorder import SessionRecorder, SessionReplay
+
+    with tempfile.TemporaryDirectory() as tmp:
+        session = args.session
+        if session is None:
+            # Synthetic session: 18 channels at 100 Hz, read in 10 ms chunks
+            session = str(Path(tmp) / "session.rec")
+            recorder = SessionRecorder(session)
+            data = capture(args.frames, args.channels)
+            chunk = args.channels * Packet.size
+            for i in range(0, len(data), chunk):
+                recorder.write(data[i:i + chunk], i // chunk * 10_000_000)
+            recorder.close()
+
+        replay = SessionReplay(session)
+        size = sum(len(data) for _, data in replay.records())
+        replay.close()
+
+        engine = FilterEngine(tracker_config(args.channels))
+        cues = []
+        engine.add_sink(lambda cue, *_: cues.append(cue))
+        interface = SensorInterface(session, engine, replay_speed=args.speed)
+
+        start = perf_counter()
+        interface.run()
+        elapsed = perf_counter() - start
+
+    frames = sum(state.frames for state in engine.snapshot.take().values())
+    print(f"{size} bytes, {frames} frames, {len(cues)} cues in {elapsed:.3f} s: "
+          f"{frames / elapsed:.0f} frames/s, {size / elapsed / 1e6:.1f} MB/s")
+
+def bench_emulator(args):
+    import resource
+    import threading
+    from emulator import ReceiverEmulator
+    from engine import FilterEngine
+    from interface import SensorInterface
+
+    emulator = ReceiverEmulator(args.channels, args.rate, noise=args.noise, corrupt=args.corrupt,
+                                loss=args.loss, duplicate=args.duplicate, reboot=args.reboot,
+                                dropout=args.dropout, dropout_length=.2, baud=args.baud, seed=1)
+    port = emulator.start()
+    config = tracker_config(args.channels)
+    engine = FilterEngine(config)
+    cues = []
+    engine.add_sink(lambda cue, *_: cues.append(cue))
+    interface = SensorInterface(port, engine)
+    thread = threading.Thread(target=interface.run)
+    thread.start()
+    # Every transmitter gets its config, like Pipeline.send_tracker_config on connect
+    for tracker in config.trackers:
+        for i, ch in enumerate(tracker.channels):
+            interface.update_config(PacketConfig(ch, tracker.threshold[i], tracker.duration[i]))
+
+    start, usage = perf_counter(), resource.getrusage(resource.RUSAGE_SELF)
+    sent = emulator.frames
+    sleep(args.duration)
+    frames = sum(state.frames for state in engine.snapshot.take().values())
+    elapsed = perf_counter() - start
+    end = resource.getrusage(resource.RUSAGE_SELF)
+    sent = emulator.frames - sent
+    interface.stop()
+    thread.join()
+    emulator.stop()
+
+    cpu = end.ru_utime + end.ru_stime - usage.ru_utime - usage.ru_stime
+    print(f"{args.channels} channels at {args.rate:g} Hz: {sent / elapsed:.0f} frames/s sent, "
+          f"{frames / elapsed:.0f} frames/s received, {len(cues)} cues, "
+          f"{cpu / elapsed * 100:.0f}% CPU (emulator included)")
+    print("emulator " + " ".join(f"{k}: {v}" for k, v in emulator.stats().items()))
+    print("decoder " + " ".join(f"{k}: {v}" for k, v in interface.decoder.stats().items()))
+    print("config " + " ".join(f"{k}: {v}" for k, v in interface.downlink.stats().items()))
+    links = engine.link_stats().values()
+    print("link " + " ".join(f"{k}: {sum(link[k] for link in links)}"
+                             for k in ["frames", "lost", "gaps", "missed motions", "reboots", "duplicates"]))
+
+def bench_latency(args):
+    import socket
+    import threading
+    from emulator import ReceiverEmulator
+    from engine import FilterEngine
+    from interface import SensorInterface
+    from latency import LatencyMonitor
+    from osc_client import OscClient
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(.1)
+    config = tracker_config(args.channels)
+    config.osc_ip, config.osc_port = receiver.getsockname()
+    config.cue_rate = 0
+
+    emulator = ReceiverEmulator(args.channels, args.rate, pattern="random", step_interval=args.step_interval, seed=1)
+    port = emulator.start()
+    monitor = LatencyMonitor()
+    engine = FilterEngine(config)
+    client = OscClient(config)
+    client.latency_monitor = monitor
+    engine.add_sink(client.send_cue)
+    interface = SensorInterface(port, engine)
+    interface.latency_monitor = monitor
+    threads = [threading.Thread(target=client.run), threading.Thread(target=interface.run)]
+    for thread in threads:
+        thread.start()
+
+    datagrams = 0
+    deadline = perf_counter() + args.duration
+    while perf_counter() < deadline:
+        try:
+            receiver.recv(1024)
+            datagrams += 1
+        except socket.timeout:
+            pass
+    interface.stop()
+    client.stop()
+    for thread in threads:
+        thread.join()
+    emulator.stop()
+
+    print(f"{args.channels} channels at {args.rate:g} Hz, {datagrams} datagrams received")
+    for stage in monitor.stages:
+        print(f"  {monitor.summary(stage)} n={monitor.histograms[stage].count}")
+    if args.json:
+        monitor.save(args.json)
+
+    # What recording costs per frame, replaying a capture through decoder and filters
+    data = capture(args.frames, args.channels)
+    best = {}
+    for _ in range(3):
+        for enabled in [False, True]:
+            engine = FilterEngine(tracker_config(args.channels))
+            engine.add_sink(lambda cue, *_: None)
+            interface = SensorInterface(None, engine)
+            interface.port = ReplayPort(data, 18 * Packet.size)
+            if enabled:
+                interface.latency_monitor = LatencyMonitor()
+            start = perf_counter()
+            while interface.port.remaining:
+                interface.poll()
+            elapsed = perf_counter() - start
+            best[enabled] = min(best.get(enabled, elapsed), elapsed)
+    for enabled, elapsed in best.items():
+        report(f"recording {'enabled' if enabled else 'disabled'}", args.frames, elapsed)
+
+def histogram(name: str, samples: list, buckets: int = 12):
+    """Percentiles and a log2-bucketed text histogram of latencies in us"""
+    samples = sorted(samples)
+    pct = lambda p: samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+    print(f"{name}: n={len(samples)} p50={pct(50):.1f}us p90={pct(90):.1f}us "
+          f"p99={pct(99):.1f}us max={samples[-1]:.1f}us")
+    counts = [0] * buckets
+    for v in samples:
+        counts[min(buckets - 1, max(0, int(v).bit_length() - 1))] += 1
+    for i, c in enumerate(counts):
+        if c:
+            label = f"{1 << i:>6d}us" + ("+" if i == buckets - 1 else " ")
+            print(f"  {label} {'#' * max(1, 60 * c // len(samples))} {c}")
+
+def bench_osc(args):
+    import queue
+    import socket
+    import threading
+    from osc_client import OscClient
+    from pythonosc import udp_client
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1)
+    cfg = tracker_config(14)
+    cfg.osc_ip, cfg.osc_port = receiver.getsockname()
+    cfg.cue_rate = 0
+    cues = [tracker.cue for tracker in cfg.trackers]
+
+    def legacy(cue_q: queue.Queue):
+        """OscClient before pre-encoding: polling queue, SimpleUDPClient.send_message"""
+        client = udp_client.SimpleUDPClient(cfg.osc_ip, cfg.osc_port)
+        while True:
+            try:
+                cue = cue_q.get(True, .5)
+                if cue is None:
+                    break
+                client.send_message(cue, 1)
+            except queue.Empty:
+                continue
+
+    def measure(send, stop):
+        latency = []
+        for i in range(args.cues):
+            start = perf_counter()
+            send(cues[i % len(cues)])
+            receiver.recv(1024)
+            latency.append((perf_counter() - start) * 1e6)
+            if args.interval:
+                sleep(args.interval / 1000)
+        stop()
+        return latency
+
+    cue_q = queue.Queue()
+    thread = threading.Thread(target=legacy, args=(cue_q,))
+    thread.start()
+    histogram("send_message", measure(cue_q.put, lambda: cue_q.put(None)))
+    thread.join()
+
+    client = OscClient(cfg)
+    thread = threading.Thread(target=client.run)
+    thread.start()
+    histogram("pre-encoded", measure(client.send_cue, client.stop))
+    thread.join()
+
+def bench_clock(args):
+    from clock import ClockSync
+
+    # One transmitter at `rate` Hz over `duration` s, frames read 2 ms plus jitter after they're sent,
+    # except during host stalls, when they're read in one go at the end of it
+    rng = random.Random(1)
+    clock = ClockSync()
+    stall_end = 0
+    arrival, synced, true = [], [], []
+    next_motion = 1.0
+    t = 0
+    while t < args.duration:
+        t += 1 / args.rate
+        if rng.random() < args.stalls / args.rate:
+            stall_end = t + args.stall / 1000
+        read = max(t + .002 + rng.expovariate(1 / .0005), stall_end)
+        sensor_ms = int(t * 1000 * (1 - args.drift * 1e-6))
+        clock.update(sensor_ms, read)
+        if t >= next_motion:
+            # Motion is stamped by the transmitter and shows up in this frame
+            true.append(next_motion)
+            arrival.append(read)
+            synced.append(clock.host_time(int(next_motion * 1000 * (1 - args.drift * 1e-6))))
+            next_motion += rng.uniform(.3, .7)
+
+    def spacing_errors(times):
+        return [abs((b - a) - (tb - ta)) * 1e6 for a, b, ta, tb in zip(times, times[1:], true, true[1:])]
+
+    print(f"{args.rate:g} Hz, {args.drift:g} ppm drift, {args.stalls:g} stalls/s of {args.stall:g} ms: "
+          f"estimated drift {clock.drift():.0f} ppm, jitter {clock.jitter():.2f} ms, {clock.resets} resets")
+    histogram("step spacing error, arrival time", spacing_errors(arrival))
+    histogram("step spacing error, synced clock", spacing_errors(synced))
+
+def bench_accel(args):
+    import numpy as np
+    from accel import AccelDetector
+    from emulator import ReceiverEmulator
+
+    # Cost per frame, reads of `chunk` frames spread over more and more channels
+    for channels in args.channels:
+        data = capture(args.frames, channels)
+        frames = np.frombuffer(data, PacketBatch.dtype)
+        chunk = args.chunk
+        best = None
+        for _ in range(3):
+            detector = AccelDetector(args.jerk, args.energy)
+            t0 = perf_counter()
+            for i in range(0, len(frames), chunk):
+                detector.process(frames[i:i + chunk])
+            t = perf_counter() - t0
+            best = t if best is None else min(best, t)
+        print(f"{channels:4d} channels, {chunk} frames per read: {best / len(frames) * 1e6:.2f} us per frame")
+
+    # Detection on emulated steps, read every 2 ms like the serial port would be
+    emulator = ReceiverEmulator(args.emulated, args.rate, "random", seed=1)
+    detector = AccelDetector(args.jerk, args.energy)
+    now = emulator.next_step - emulator.step_interval
+    step_ms = emulator.step_length * 1000
+    steps = fired = false = frames = 0
+    up = 0
+    for _ in range(int(args.duration / emulator.tick)):
+        now += emulator.tick
+        batch = np.frombuffer(emulator.frames_due(now), PacketBatch.dtype)
+        bits = detector.process(batch)
+        frames += len(batch)
+        since = (batch["sensor_time"] - batch["motion_time"]).astype(np.int64) & 0xffffffff
+        step = (batch["motion"] != 0) & (since == 0)
+        steps += int(step.sum())
+        fired += int((step & (bits != 0)).sum())
+        up += int((step & (bits & (1 << 2) != 0)).sum())
+        false += int(((bits != 0) & (since > step_ms)).sum())
+    print(f"{args.emulated} channels at {args.rate:g} Hz, {args.duration:g} s, jerk {args.jerk:g} g/s, "
+          f"energy {args.energy:g} g^2: {frames} frames, {steps} steps")
+    print(f"  fired on the step frame: {fired} ({fired / max(steps, 1):.1%}), z up: {up}")
+    print(f"  fired outside a step: {false} ({false / max(frames, 1):.3%} of frames)")
+
+def bench_config(args):
+    import tempfile
+    import yaml
+    from pathlib import Path
+    from config import Config, SafeLoader, SafeDumper
+
+    config = tracker_config(args.channels)
+    legacy_text = yaml.dump(config)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "config.yml"
+        config.save(path)
+        text = path.read_text()
+
+        def measure(name, fn):
+            start = perf_counter()
+            for _ in range(args.repeat):
+                fn()
+            elapsed = (perf_counter() - start) / args.repeat
+            print(f"{name:>28s}: {elapsed * 1000:7.2f} ms")
+
+        measure("yaml.Loader python/object", lambda: yaml.load(legacy_text, Loader=yaml.Loader))
+        measure(f"{SafeLoader.__name__} plain", lambda: yaml.load(text, Loader=SafeLoader))
+        measure("yaml.dump python/object", lambda: yaml.dump(config))
+        measure(f"{SafeDumper.__name__} plain", config.dump)
+        measure("Config.save atomic", lambda: config.save(path))
+
+def bench_reload(args):
+    import copy
+    import random
+    from headless import Pipeline
+
+    app = qt_app()
+    pipeline = Pipeline(tracker_config(args.channels))
+    sent = []
+    pipeline.update_tracker_config = sent.append
+    channels = sum(len(t.channels) for t in pipeline.config.trackers)
+
+    times = []
+    for _ in range(args.repeat):
+        new = copy.deepcopy(pipeline.config)
+        for tracker in random.sample(new.trackers, min(args.changes, len(new.trackers))):
+            tracker.threshold[random.randrange(len(tracker.channels))] += 1
+        sent.clear()
+        start = perf_counter()
+        pipeline.apply_config(new)
+        times.append(perf_counter() - start)
+    print(f"{channels} channels, {args.changes} thresholds changed: apply {min(times) * 1000:.3f} ms (best of "
+          f"{args.repeat}), {len(sent)} transmitter configs sent instead of {channels}")
+
+# Mirrors the voetstappen.py startup path, stopping once there is something on screen
+STARTUP = """
+import sys, resource
+from PyQt6.QtCore import QEvent, QObject, QTimer
+from config import Config
+config = Config.load(sys.argv[1])
+
+def ready():
+    print("ready", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, flush=True)
+    QTimer.singleShot(0, app.quit)
+
+if sys.argv[2] == "headless":
+    from PyQt6.QtCore import QCoreApplication
+    from headless import Pipeline
+    app = QCoreApplication(sys.argv)
+    pipeline = Pipeline(config)
+    QTimer.singleShot(0, ready)
+else:
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication(sys.argv)
+    from window import MainWindow
+    from headless import Pipeline
+    pipeline = Pipeline(config)
+    window = MainWindow(pipeline, sys.argv[1])
+
+    class FirstFrame(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Type.Paint and obj is window:
+                window.removeEventFilter(self)
+                ready()
+            return False
+    first_frame = FirstFrame()
+    window.installEventFilter(first_frame)
+    window.show()
+app.exec()
+"""
+
+# What each startup path imports before its event loop runs
+STARTUP_IMPORTS = {
+    "headless": "import config, headless",
+    "gui": "import config; from PyQt6.QtWidgets import QApplication; import window, headless",
+}
+
+def bench_startup(args):
+    import os
+    import statistics
+    import subprocess
+    import sys
+    import tempfile
+    from pathlib import Path
+
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    with tempfile.TemporaryDirectory() as tmp:
+        config = str(Path(tmp) / "config.yml")
+        for mode in ["headless", "gui"]:
+            times, rss = [], []
+            for _ in range(args.repeat):
+                start = perf_counter()
+                proc = subprocess.Popen([sys.executable, "-c", STARTUP, config, mode], env=env,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                for line in proc.stdout:
+                    if line.startswith("ready"):
+                        times.append(perf_counter() - start)
+                        rss.append(int(line.split()[1]) / 1024)
+                proc.wait()
+            median = statistics.median(times) * 1000
+            # The target depends on the machine, check against the show machine's with --target
+            target = f", target {args.target:g} ms" + (" MISSED" if median > args.target else "") \
+                     if mode == "gui" and args.target else ""
+            print(f"{mode:8s}: start to first frame median {median:.0f} ms (min {min(times) * 1000:.0f}){target}, "
+                  f"max RSS {statistics.median(rss):.1f} MB")
+
+def bench_importtime(args):
+    """python -X importtime of the startup imports, summed per top level package"""
+    import subprocess
+    import sys
+    from collections import Counter
+
+    for mode, imports in STARTUP_IMPORTS.items():
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", imports],
+                                stderr=subprocess.PIPE, text=True)
+        packages = Counter()
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            own, _, name = line[len("import time:"):].split("|")
+            packages[name.strip().split(".")[0]] += int(own)
+        print(f"{mode}: {sum(packages.values()) / 1000:.1f} ms in imports")
+        for name, own in packages.most_common(args.top):
+            print(f"  {own / 1000:7.1f} ms  {name}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(required=True)
+
+    p = sub.add_parser("decoder", help="serial frame decoding throughput")
+    p.add_argument("--frames", type=int, default=200000)
+    p.add_argument("--chunk", type=int, default=1024, help="bytes waiting per read")
+    p.add_argument("--capture", type=str, help="raw serial capture to replay")
+    p.set_defaults(func=bench_decoder)
+
+    p = sub.add_parser("table", help="TrackerTable packet dispatch")
+    p.add_argument("--frames", type=int, default=20000)
+    p.add_argument("--channels", type=int, default=18, help="3 radios x 6 pipes")
+    p.set_defaults(func=bench_table)
+
+    p = sub.add_parser("flash", help="motion/cue flashes in the tracker table")
+    p.add_argument("--flashes", type=int, default=20000)
+    p.add_argument("--channels", type=int, default=18)
+    p.add_argument("--batch", type=int, default=20, help="flashes per event loop pass")
+    p.set_defaults(func=bench_flash)
+
+    p = sub.add_parser("packet", help="Packet construction speed and memory")
+    p.add_argument("--rate", type=int, default=10000, help="packets per second of traffic")
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_packet)
+
+    p = sub.add_parser("pipeline", help="replay a session through decoder and filters")
+    p.add_argument("--session", type=str, help="SessionRecorder log, synthetic if not given")
+    p.add_argument("--frames", type=int, default=200000)
+    p.add_argument("--channels", type=int, default=18)
+    p.add_argument("--speed", type=float, default=0, help="replay speed, 0 for as fast as possible")
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("emulator", help="live frames from the receiver emulator through SensorInterface")
+    p.add_argument("--channels", type=int, default=18)
+    p.add_argument("--rate", type=float, default=200, help="frames per second per channel")
+    p.add_argument("--duration", type=float, default=5, help="s")
+    p.add_argument("--noise", type=float, default=0, help="bursts of garbage bytes per second")
+    p.add_argument("--corrupt", type=float, default=0, help="fraction of frames with a flipped bit")
+    p.add_argument("--loss", type=float, default=0, help="fraction of frames lost over the radio")
+    p.add_argument("--duplicate", type=float, default=0, help="fraction of frames forwarded twice")
+    p.add_argument("--reboot", type=float, default=0, help="transmitter reboots per channel per second")
+    p.add_argument("--dropout", type=float, default=0, help="200 ms dropouts per channel per second")
+    p.add_argument("--baud", type=int, default=0, help="cap the link, e.g. 115200")
+    p.set_defaults(func=bench_emulator)
+
+    p = sub.add_parser("latency", help="per-stage latency from the receiver emulator to OSC, and its overhead")
+    p.add_argument("--channels", type=int, default=18)
+    p.add_argument("--rate", type=float, default=100, help="frames per second per channel")
+    p.add_argument("--step-interval", type=float, default=.5, help="mean s between steps per channel")
+    p.add_argument("--duration", type=float, default=5, help="s")
+    p.add_argument("--frames", type=int, default=200000, help="frames replayed for the overhead")
+    p.add_argument("--json", type=str, help="save the histograms to this file")
+    p.set_defaults(func=bench_latency)
+
+    p = sub.add_parser("osc", help="cue enqueue to UDP receive latency over loopback")
+    p.add_argument("--cues", type=int, default=5000)
+    p.add_argument("--interval", type=float, default=0.2, help="ms between cues")
+    p.set_defaults(func=bench_osc)
+
+    p = sub.add_parser("reload", help="apply a changed config to a running pipeline")
+    p.add_argument("--channels", type=int, default=200)
+    p.add_argument("--changes", type=int, default=3)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_reload)
+
+    p = sub.add_parser("clock", help="motion timing from arrival time vs the synced transmitter clock")
+    p.add_argument("--rate", type=float, default=100, help="frames per second")
+    p.add_argument("--duration", type=float, default=600, help="simulated s")
+    p.add_argument("--drift", type=float, default=50, help="transmitter clock error in ppm")
+    p.add_argument("--stalls", type=float, default=.5, help="host stalls per second")
+    p.add_argument("--stall", type=float, default=80, help="ms per stall")
+    p.set_defaults(func=bench_clock)
+
+    p = sub.add_parser("accel", help="host-side motion detection from the acceleration, cost and hits")
+    p.add_argument("--channels", type=int, nargs="+", default=[6, 18, 64, 200])
+    p.add_argument("--frames", type=int, default=100000)
+    p.add_argument("--chunk", type=int, default=256, help="frames per read")
+    p.add_argument("--emulated", type=int, default=18, help="channels of emulated steps")
+    p.add_argument("--rate", type=float, default=100, help="keepalives per second per channel")
+    p.add_argument("--duration", type=float, default=60, help="emulated s")
+    p.add_argument("--jerk", type=float, default=20, help="g/s")
+    p.add_argument("--energy", type=float, default=.01, help="g^2")
+    p.set_defaults(func=bench_accel)
+
+    p = sub.add_parser("config", help="config load and save")
+    p.add_argument("--channels", type=int, default=18)
+    p.add_argument("--repeat", type=int, default=50)
+    p.set_defaults(func=bench_config)
+
+    p = sub.add_parser("startup", help="time to first frame and memory, headless and with the GUI")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--target", type=float, default=0, help="ms to first GUI frame to check against, 0 for none")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("importtime", help="import time of the startup path per top level module")
+    p.add_argument("--top", type=int, default=10)
+    p.set_defaults(func=bench_importtime)
+
+    args = parser.parse_args()
+    args.func(args)
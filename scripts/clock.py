@@ -0,0 +1,104 @@
+class ClockSync():
+    """
+    Maps a transmitter's millis() to host monotonic time.
+
+    Every frame is a sample (sensor ms, host time it was read). A running,
+    exponentially weighted linear regression over them gives the offset and
+    the drift of the transmitter crystal. Frames read late, because the host
+    or the serial buffer stalled, are kept out of the fit: they arrive
+    further above the line than the usual jitter, so what goes in is the
+    radio and serial delay of a frame that wasn't held up.
+
+    The transmitter counter wraps after 49.7 days, that's unwrapped. When it
+    jumps back otherwise the transmitter rebooted and the fit starts over.
+    """
+    __slots__ = ("alpha", "max_drift", "warmup", "max_rejected",
+                 "base_ms", "base_host", "last_ms", "wraps", "count", "rejected",
+                 "mx", "my", "cxx", "cxy", "deviation", "slope", "resets")
+
+    def __init__(self, window: int = 2000, max_drift: float = 1e-3, warmup: int = 20):
+        # Weight of a sample, the fit covers about the last `window` samples
+        self.alpha = 2 / (window + 1)
+        self.max_drift = max_drift
+        self.warmup = warmup
+        # After this many rejected samples in a row the delay really changed
+        self.max_rejected = 200
+        self.resets = -1
+        self.reset()
+
+    def reset(self):
+        self.base_ms = None
+        self.base_host = 0.0
+        self.last_ms = 0
+        self.wraps = 0
+        self.count = 0
+        self.rejected = 0
+        self.mx = self.my = self.cxx = self.cxy = 0.0
+        self.deviation = 0.0
+        self.slope = 1.0
+        self.resets += 1
+
+    def unwrap(self, sensor_ms: int) -> int:
+        """Sensor time as a continuous count, wraps of the 32 bit counter added"""
+        ms = sensor_ms + (self.wraps << 32)
+        if ms < self.last_ms - (1 << 31):
+            ms += 1 << 32
+        elif ms > self.last_ms + (1 << 31):
+            ms -= 1 << 32
+        return ms
+
+    def update(self, sensor_ms: int, host: float) -> bool:
+        """Add a sample, False if it was left out as late"""
+        if self.base_ms is None:
+            self.base_ms, self.base_host, self.last_ms = sensor_ms, host, sensor_ms
+        ms = self.unwrap(sensor_ms)
+        if ms < self.last_ms - 1000:
+            # A second back is no reordering, the transmitter started over
+            self.reset()
+            return self.update(sensor_ms, host)
+        if ms > self.last_ms:
+            self.wraps = ms >> 32
+            self.last_ms = ms
+
+        x = (ms - self.base_ms) / 1000
+        y = host - self.base_host
+        mx, my, slope, count = self.mx, self.my, self.slope, self.count
+        if count >= self.warmup:
+            residual = y - (my + slope * (x - mx))
+            if residual > 4 * self.deviation + .002:
+                self.rejected += 1
+                if self.rejected > self.max_rejected:
+                    self.reset()
+                    return self.update(sensor_ms, host)
+                return False
+            self.deviation += self.alpha * (abs(residual) - self.deviation)
+        self.rejected = 0
+
+        # The first samples get more weight so the fit settles quickly
+        a = self.alpha if count * self.alpha >= 1 else 1 / (count + 1)
+        dx = x - mx
+        dy = y - my
+        self.mx = mx + a * dx
+        self.my = my + a * dy
+        cxx = self.cxx = (1 - a) * (self.cxx + a * dx * dx)
+        cxy = self.cxy = (1 - a) * (self.cxy + a * dx * dy)
+        if cxx > 0:
+            self.slope = min(max(cxy / cxx, 1 - self.max_drift), 1 + self.max_drift)
+        self.count += 1
+        return True
+
+    def synced(self) -> bool:
+        return self.count >= self.warmup
+
+    def host_time(self, sensor_ms: int) -> float:
+        """Host monotonic time of a sensor time, e.g. Packet.motion_time"""
+        x = (self.unwrap(sensor_ms) - self.base_ms) / 1000
+        return self.base_host + self.my + self.slope * (x - self.mx)
+
+    def drift(self) -> float:
+        """Transmitter clock drift in ppm, positive when it runs slow"""
+        return (self.slope - 1) * 1e6
+
+    def jitter(self) -> float:
+        """Mean deviation of the frames in the fit from it, in ms"""
+        return self.deviation * 1000
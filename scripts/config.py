@@ -1,190 +1,40 @@
-from PyQt6.QtWidgets import *
-from PyQt6.QtCore import pyqtSignal, Qt
-from PyQt6.QtGui import QIcon
-
 import yaml
+import os
 from pathlib import Path
-from serial.tools.list_ports import comports
-from math import inf
+from copy import deepcopy
 from typing import List
 
-class ConfigForm(QWidget):
-    config_changed = pyqtSignal(object, str)
-    serial_connect = pyqtSignal(str)
-    osc_connect = pyqtSignal(str, int)
-    config_saved = pyqtSignal()
-
-    def __init__(self, config, config_path):
-
-        super(ConfigForm, self).__init__()
-
-        self.config = config
-        self.config_path = config_path
-
-        layout = QHBoxLayout()
-
-        # General config
-        box = QGroupBox("Connection")
-        form = QFormLayout()
-
-        layout_connect = QHBoxLayout()
-
-        self.btn_refresh = QPushButton(QIcon.fromTheme("view-refresh"), None)
-        # self.btn_refresh.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_BrowserReload))
-        self.btn_refresh.clicked.connect(self.serial_refresh_ports)
-        layout_connect.addWidget(self.btn_refresh)
-
-        # Serial port combo box
-        tag, name = ("serial_port", "Serial port")
-        item = QComboBox()
-        item.setPlaceholderText(name)
-        item.setObjectName(tag)
-        item.currentIndexChanged.connect(self.update_config)
-        layout_connect.addWidget(item)
-        self.combo_serial = item
-
-        self.btn_connect_serial = QPushButton(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPlay), None)
-        self.btn_connect_serial.clicked.connect(self.serial_connect_clicked)
-        self.btn_connect_serial.setEnabled(False)
-        layout_connect.addWidget(self.btn_connect_serial)
-
-        self.serial_refresh_ports()
-
-        form.addRow(self.tr("port"), layout_connect)
-
-        # Auto-start
-        tag, name = ("autostart", "auto-start")
-        item = QCheckBox()
-        item.setCheckState(Qt.CheckState.Checked if self.config.autostart else Qt.CheckState.Unchecked)
-        item.setObjectName(tag)
-        item.stateChanged.connect(self.update_config)
-        form.addRow(self.tr(name), item)
-
-        box.setLayout(form)
-        layout.addWidget(box)
-
-        # OSC config
-        box = QGroupBox("OSC Server Config")
-        form_with_button = QVBoxLayout()
-
-        form = QFormLayout()
-
-        # OSC server IP
-        tag, name = ("osc_ip", "IP address")
-        item = QLineEdit()
-        item.setPlaceholderText(name)
-        item.setText(getattr(self.config, tag))
-        item.setObjectName(tag)
-        item.textChanged.connect(self.update_config)
-        form.addRow(self.tr(name), item)
-
-        # OSC port
-        tag, name = ("osc_port", "UDP port")
-        item = QSpinBox()
-        item.setMinimum(1024)
-        item.setMaximum(60000)
-        item.setValue(getattr(self.config, tag))
-        item.setObjectName(tag)
-        item.valueChanged.connect(self.update_config)
-        form.addRow(self.tr(name), item)
-
-        form_with_button.addLayout(form)
-
-        # OSC connect button
-        self.btn_connect_osc = QPushButton("Connect")
-        self.btn_connect_osc.clicked.connect(self.osc_connect_clicked)
-        form_with_button.addWidget(self.btn_connect_osc)
-
-        box.setLayout(form_with_button)
-
-        layout.addWidget(box)
+# libyaml when it's there, it's several times faster than the pure Python one
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
 
-        btn_save = QPushButton("save configuration")
-        btn_save.clicked.connect(self.save_clicked)
-        layout_v = QVBoxLayout()
-        layout_v.addLayout(layout)
-        layout_v.addWidget(btn_save)
+class LegacyLoader(SafeLoader):
+    """
+    Reads config files written with !!python/object tags as plain mappings,
+    for the config classes only instead of constructing arbitrary objects.
+    """
 
-        self.setLayout(layout_v)
+for name in ["Config", "TrackerConfig", "OscTarget"]:
+    LegacyLoader.add_constructor(f"tag:yaml.org,2002:python/object:config.{name}",
+                                 lambda loader, node: loader.construct_mapping(node, deep=True))
 
-    def update_config(self, args = None):
-        item = self.sender()
-        tag = item.objectName()
-
-        # print(f"Updating config from {tag}")
-        if isinstance(item, QSpinBox) or \
-           isinstance(item, QDoubleSpinBox):
-            setattr(self.config, tag, item.value())
-        elif isinstance(item, QLineEdit):
-            setattr(self.config, tag, item.text())
-        elif isinstance(item, QComboBox):
-            setattr(self.config, tag, item.currentData())
-        elif isinstance(item, QCheckBox):
-            state = item.checkState() == Qt.CheckState.Checked
-            setattr(self.config, tag, state)
-        elif isinstance(item, QTableWidget):
-            dictionary = getattr(self.config, tag)
-            assert(isinstance(dictionary, dict))
-            key = args.data(Qt.ItemDataRole.UserRole)
-            value = args.text()
-            print(f"key {key} value {value}")
-            dictionary[key] = value
-            setattr(self.config, tag, dictionary)
-        else:
-            raise AttributeError(f"No config handler for {tag} / {item}")
-
-        match tag:
-            case "serial_port":
-                self.btn_connect_serial.setEnabled(item.currentData() is not None)
-
-        self.config_changed.emit(self.config, tag)
-
-    def update_trigger(self, channel: int, axis: int, direction: int, level: float, enabled: bool):
-        self.config.levels[channel][axis * 2 + direction] = level if enabled else inf if direction == 0 else -inf
-
-    def save_clicked(self):
-        # print(self.config.dump())
-        self.config.save(self.config_path)
-        self.config_saved.emit()
-
-    def serial_refresh_ports(self):
-        currentPort = self.combo_serial.currentData()
-        self.combo_serial.clear()
-        for i, p in enumerate(comports()):
-            if not p.hwid.startswith("USB"):
-                continue
-            self.combo_serial.addItem(f"{p.name} - {p.description}", p.device)
-
-        currentIndex = self.combo_serial.findData(currentPort)
-        if currentIndex == -1:
-            currentIndex = self.combo_serial.findData(self.config.serial_port)
-        self.combo_serial.setCurrentIndex(currentIndex)
-
-    def serial_connect_clicked(self):
-        self.combo_serial.setEnabled(False)
-        self.btn_refresh.setEnabled(False)
-        self.btn_connect_serial.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaStop))
-        self.serial_connect.emit(self.config.serial_port)
-
-    def serial_connected(self, connected: bool):
-        if connected:
-            return
-
-        self.serial_refresh_ports()
-        self.combo_serial.setEnabled(True)
-        self.btn_refresh.setEnabled(True)
-        self.btn_connect_serial.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPlay))
-
-    def osc_connect_clicked(self):
-        self.btn_connect_osc.setEnabled(False)
-        self.btn_connect_osc.setText(self.btn_connect_osc.text() + "ing")
-        self.osc_connect.emit(self.config.osc_ip, self.config.osc_port)
-
-    def osc_connected(self, connected: bool):
-        self.btn_connect_osc.setText("Disconnect" if connected else "Connect")
-        self.btn_connect_osc.setEnabled(True)
+class OscTarget(yaml.YAMLObject):
+    def __init__(self, name: str, ip: str, port: int, enabled: bool = True):
+        self.name = name
+        self.ip = ip
+        self.port = port
+        self.enabled = enabled
 
 class TrackerConfig(yaml.YAMLObject):
+    # One per foot, see Config.valid
+    valid = {
+        "channels": lambda v: len(v) == 2 and all(isinstance(x, int) for x in v),
+        "threshold": lambda v: len(v) == 2 and all(isinstance(x, int) for x in v),
+        "duration": lambda v: len(v) == 2 and all(isinstance(x, int) for x in v),
+        "axes": lambda v: len(v) == 2 and all(isinstance(x, list) and len(x) == 6 for x in v),
+        "cue": lambda v: v.startswith("/"), # An OSC address
+    }
+
     def __init__(self,
                  channels: List[int],
                  threshold: List[int],
@@ -192,7 +42,9 @@ class TrackerConfig(yaml.YAMLObject):
                  axes: List[bool],
                  cue: str,
                  repeat_same: int,
-                 repeat_different: int):
+                 repeat_different: int,
+                 targets: List[str] = None,
+                 priority: int = 0):
         self.channels = channels
         self.threshold = threshold
         self.duration = duration
@@ -200,14 +52,34 @@ class TrackerConfig(yaml.YAMLObject):
         self.axes = axes
         self.repeat_same = repeat_same
         self.repeat_different = repeat_different
+        self.targets = targets or [] # OSC target names, empty for all
+        self.priority = priority # Higher goes first when the cue rate is limited
 
 class Config(yaml.YAMLObject):
+    # Checks on values for keys where the type alone doesn't say enough
+    valid = {
+        "cue_overflow": lambda v: v in ("drop", "delay"),
+        "accel_mode": lambda v: v in ("off", "either", "only"),
+        "gui_fps": lambda v: v > 0,
+    }
+
     def __init__(self):
         self.osc_ip = "10.10.10.2"
         self.osc_port = 5302
+        self.osc_bundle_window = 0 # ms, 0 sends every cue on its own
+        self.osc_targets = [] # Sent to as well as osc_ip:osc_port ("primary")
+        self.cue_rate = 4 # Cues per second over all trackers, 0 for no limit
+        self.cue_burst = 4
+        self.cue_overflow = "drop" # or "delay"
+        self.cue_max_delay = 1000 # ms a delayed cue may wait before it's dropped after all
         self.channels = [1,2]
         self.serial_port = ""
         self.autostart = False
+        self.gui_fps = 30
+        self.autosave = 0 # ms after the last change to save, 0 (off) to only save on request
+        self.accel_mode = "off" # Host-side detection from the acceleration: "either" besides the motion bits, "only" instead
+        self.accel_jerk = 20.0 # g/s on one axis
+        self.accel_energy = 0.01 # g^2, of the acceleration magnitude over the last few frames
 
         self.trackers = []
         for i in range(7):
@@ -220,31 +92,113 @@ class Config(yaml.YAMLObject):
                                     repeat_different=500,
                                     repeat_same=500))
 
+    def to_dict(self) -> dict:
+        d = dict(self.__dict__)
+        d["trackers"] = [dict(t.__dict__) for t in self.trackers]
+        d["osc_targets"] = [dict(t.__dict__) for t in self.osc_targets]
+        return d
+
     def dump(self):
-        return yaml.dump(self)
+        return yaml.dump(self.to_dict(), Dumper=SafeDumper, sort_keys=False)
 
     def save(self, file):
-        with open(file, "w") as f:
-            f.write(self.dump())
+        """Writes a temporary file next to `file` and renames it, so `file` is always complete"""
+        import tempfile # Only needed once something is saved, keep it off the startup path
+        path = Path(file)
+        fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+        try:
+            os.chmod(tmp, path.stat().st_mode & 0o777 if path.exists() else 0o644)
+            with os.fdopen(fd, "w") as f:
+                f.write(self.dump())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except:
+            os.unlink(tmp)
+            raise
+
+    @staticmethod
+    def bad(message: str, strict: bool):
+        """A problem with the values, that `strict` doesn't let go"""
+        if strict:
+            raise ValueError(message)
+        print(f"removing {message}")
+
+    @staticmethod
+    def checked(default: dict, values: dict, what: str, valid: dict = {}, strict: bool = False) -> dict:
+        """
+        `values` with unknown, badly typed and invalid (see `valid`) keys
+        dropped and missing keys from `default`. With `strict` badly typed
+        and invalid keys raise ValueError instead.
+        """
+        checked = {}
+        for (k, v) in values.items():
+            if k not in default:
+                print(f"removing unknown key {k}{what}")
+            elif not Config.same_type(default[k], v):
+                Config.bad(f"bad typed key {k}{what} {type(v).__name__}", strict)
+            elif k in valid and not valid[k](v):
+                Config.bad(f"bad value of key {k}{what} {v!r}", strict)
+            else:
+                checked[k] = v
+
+        for (k, v) in default.items():
+            if k not in checked:
+                print(f"adding missing key {k}{what}")
+                checked[k] = deepcopy(v)
+        return checked
+
+    @staticmethod
+    def same_type(default, value) -> bool:
+        if isinstance(default, bool) or isinstance(value, bool):
+            return isinstance(default, bool) and isinstance(value, bool)
+        if isinstance(default, (int, float)):
+            return isinstance(value, (int, float))
+        return isinstance(value, type(default))
 
     @classmethod
-    def validate(cls, o):
-        default = cls()
-        remove_list = []
-        for (k, v) in o.__dict__.items():
-            if k not in default.__dict__:
-                print(f"removing unknown key {k}")
-                remove_list.append(k)
-            # elif not isinstance(v, type(default.__dict__[k])):
-            #     print(f"removing bad typed key {k} {type(v)}")
-            #     remove_list.append(k)
-        [o.__dict__.pop(k) for k in remove_list]
+    def from_dict(cls, values: dict, strict: bool = False) -> "Config":
+        """
+        Config from plain yaml, checked against the defaults. With `strict`
+        any bad value raises ValueError rather than being replaced.
+        """
+        config = cls()
+        default = config.to_dict()
+        default_tracker = default["trackers"][0]
+        default_target = dict(OscTarget("", "", 0).__dict__)
+        config.__dict__.update(cls.checked(default, values, "", cls.valid, strict))
+
+        trackers = []
+        for i, tracker in enumerate(config.trackers):
+            if not isinstance(tracker, dict):
+                cls.bad(f"bad tracker {i}", strict)
+                continue
+            trackers.append(TrackerConfig(**cls.checked(default_tracker, tracker, f" in tracker {i}", TrackerConfig.valid, strict)))
+        config.trackers = trackers
 
-        for (k, v) in default.__dict__.items():
-            if k not in o.__dict__:
-                print(f"adding missing key {k}")
-                o.__dict__[k] = v
+        targets = []
+        for i, target in enumerate(config.osc_targets):
+            if not isinstance(target, dict):
+                cls.bad(f"bad OSC target {i}", strict)
+                continue
+            targets.append(OscTarget(**cls.checked(default_target, target, f" in OSC target {i}", strict=strict)))
+        config.osc_targets = targets
+        return config
 
+    def osc_destinations(self) -> List[OscTarget]:
+        """The primary OSC server from the form plus the enabled extra targets"""
+        return [OscTarget("primary", self.osc_ip, self.osc_port)] + \
+               [t for t in self.osc_targets if t.enabled]
+
+    @classmethod
+    def read(cls, path, strict: bool = False) -> "Config":
+        with open(path, 'r') as f:
+            # Older files are tagged !!python/object:config.Config
+            values = yaml.load(f.read(), Loader=LegacyLoader)
+
+        if not isinstance(values, dict):
+            raise ValueError(f"{path} is not a config file")
+        return cls.from_dict(values, strict)
 
     @classmethod
     def load(cls, path):
@@ -254,9 +208,4 @@ class Config(yaml.YAMLObject):
             print(f"Writing default config to new config file")
             Config().save(config_path)
 
-        with open(config_path, 'r') as f:
-            config = yaml.load(f.read(), Loader=yaml.Loader)
-
-        assert(isinstance(config, cls))
-        cls.validate(config)
-        return config
\ No newline at end of file
+        return cls.read(config_path)
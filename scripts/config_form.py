@@ -0,0 +1,337 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import QThreadPool, pyqtSignal, Qt
+from PyQt6.QtGui import QIcon
+
+import os
+from math import inf
+from worker import Worker
+
+def list_usb_ports() -> list:
+    """(label, device) of the USB serial ports"""
+    from serial.tools.list_ports import comports
+    return [(f"{p.name} - {p.description}", p.device) for p in comports() if p.hwid.startswith("USB")]
+
+class ConfigForm(QWidget):
+    config_changed = pyqtSignal(object, str)
+    serial_connect = pyqtSignal(str)
+    osc_connect = pyqtSignal(str, int)
+    config_saved = pyqtSignal()
+    ports_listed = pyqtSignal()
+
+    def __init__(self, config, config_path, port: str = None):
+        """`port` is offered and selected first, but never stored in the config"""
+
+        super(ConfigForm, self).__init__()
+
+        self.config = config
+        self.config_path = config_path
+        self.port_override = port
+        self.closing = False # No more port refreshes, their worker would outlive the window
+
+        layout = QHBoxLayout()
+
+        # General config
+        box = QGroupBox("Connection")
+        form = QFormLayout()
+
+        layout_connect = QHBoxLayout()
+
+        self.btn_refresh = QPushButton(QIcon.fromTheme("view-refresh"), None)
+        # self.btn_refresh.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_BrowserReload))
+        self.btn_refresh.clicked.connect(self.serial_refresh_ports)
+        layout_connect.addWidget(self.btn_refresh)
+
+        # Serial port combo box
+        tag, name = ("serial_port", "Serial port")
+        item = QComboBox()
+        item.setPlaceholderText(name)
+        item.setObjectName(tag)
+        item.currentIndexChanged.connect(self.update_config)
+        layout_connect.addWidget(item)
+        self.combo_serial = item
+
+        self.btn_connect_serial = QPushButton(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPlay), None)
+        self.btn_connect_serial.clicked.connect(self.serial_connect_clicked)
+        self.btn_connect_serial.setEnabled(False)
+        layout_connect.addWidget(self.btn_connect_serial)
+
+        self.serial_refresh_ports()
+
+        form.addRow(self.tr("port"), layout_connect)
+
+        # Auto-start
+        tag, name = ("autostart", "auto-start")
+        item = QCheckBox()
+        item.setCheckState(Qt.CheckState.Checked if self.config.autostart else Qt.CheckState.Unchecked)
+        item.setObjectName(tag)
+        item.stateChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        # Autosave
+        tag, name = ("autosave", "autosave after")
+        item = QSpinBox()
+        item.setMinimum(0)
+        item.setMaximum(60000)
+        item.setSingleStep(500)
+        item.setSuffix(" ms")
+        item.setSpecialValueText("off")
+        item.setValue(getattr(self.config, tag))
+        item.setObjectName(tag)
+        item.valueChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        box.setLayout(form)
+        layout.addWidget(box)
+
+        # OSC config
+        box = QGroupBox("OSC Server Config")
+        form_with_button = QVBoxLayout()
+
+        form = QFormLayout()
+
+        # OSC server IP
+        tag, name = ("osc_ip", "IP address")
+        item = QLineEdit()
+        item.setPlaceholderText(name)
+        item.setText(getattr(self.config, tag))
+        item.setObjectName(tag)
+        item.textChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        # OSC port
+        tag, name = ("osc_port", "UDP port")
+        item = QSpinBox()
+        item.setMinimum(1024)
+        item.setMaximum(60000)
+        item.setValue(getattr(self.config, tag))
+        item.setObjectName(tag)
+        item.valueChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        # Bundle window
+        tag, name = ("osc_bundle_window", "bundle window")
+        item = QSpinBox()
+        item.setMinimum(0)
+        item.setMaximum(20)
+        item.setSuffix(" ms")
+        item.setSpecialValueText("off")
+        item.setValue(getattr(self.config, tag))
+        item.setObjectName(tag)
+        item.valueChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        form_with_button.addLayout(form)
+
+        # OSC connect button
+        self.btn_connect_osc = QPushButton("Connect")
+        self.btn_connect_osc.clicked.connect(self.osc_connect_clicked)
+        form_with_button.addWidget(self.btn_connect_osc)
+
+        box.setLayout(form_with_button)
+
+        layout.addWidget(box)
+
+        # Cue rate limit
+        box = QGroupBox("Cue limit")
+        form = QFormLayout()
+
+        tag, name = ("cue_rate", "cues / s")
+        item = QDoubleSpinBox()
+        item.setMinimum(0)
+        item.setMaximum(100)
+        item.setSingleStep(.5)
+        item.setSpecialValueText("no limit")
+        item.setValue(getattr(self.config, tag))
+        item.setObjectName(tag)
+        item.valueChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        tag, name = ("cue_burst", "burst")
+        item = QSpinBox()
+        item.setMinimum(1)
+        item.setMaximum(20)
+        item.setValue(getattr(self.config, tag))
+        item.setObjectName(tag)
+        item.valueChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        tag, name = ("cue_overflow", "over limit")
+        item = QComboBox()
+        item.addItem("drop cue", "drop")
+        item.addItem("delay cue", "delay")
+        item.setCurrentIndex(item.findData(getattr(self.config, tag)))
+        item.setObjectName(tag)
+        item.currentIndexChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        box.setLayout(form)
+        layout.addWidget(box)
+
+        # Host-side detection from the acceleration
+        box = QGroupBox("Acceleration")
+        form = QFormLayout()
+
+        tag, name = ("accel_mode", "detect")
+        item = QComboBox()
+        item.addItem("motion bits only", "off")
+        item.addItem("bits or acceleration", "either")
+        item.addItem("acceleration only", "only")
+        item.setCurrentIndex(item.findData(getattr(self.config, tag)))
+        item.setObjectName(tag)
+        item.currentIndexChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        tag, name = ("accel_jerk", "jerk")
+        item = QDoubleSpinBox()
+        item.setMinimum(0)
+        item.setMaximum(1000)
+        item.setSingleStep(5)
+        item.setSuffix(" g/s")
+        item.setValue(getattr(self.config, tag))
+        item.setObjectName(tag)
+        item.valueChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        tag, name = ("accel_energy", "energy")
+        item = QDoubleSpinBox()
+        item.setDecimals(3)
+        item.setMinimum(0)
+        item.setMaximum(4)
+        item.setSingleStep(.005)
+        item.setSuffix(" g²")
+        item.setValue(getattr(self.config, tag))
+        item.setObjectName(tag)
+        item.valueChanged.connect(self.update_config)
+        form.addRow(self.tr(name), item)
+
+        box.setLayout(form)
+        layout.addWidget(box)
+
+        btn_save = QPushButton("save configuration")
+        btn_save.clicked.connect(self.save_clicked)
+        layout_v = QVBoxLayout()
+        layout_v.addLayout(layout)
+        layout_v.addWidget(btn_save)
+
+        self.setLayout(layout_v)
+
+    def update_config(self, args = None):
+        item = self.sender()
+        tag = item.objectName()
+
+        if tag == "serial_port" and item.currentData() == self.port_override:
+            # Only for this run, the configured port stays
+            self.btn_connect_serial.setEnabled(True)
+            return
+
+        # print(f"Updating config from {tag}")
+        if isinstance(item, QSpinBox) or \
+           isinstance(item, QDoubleSpinBox):
+            setattr(self.config, tag, item.value())
+        elif isinstance(item, QLineEdit):
+            setattr(self.config, tag, item.text())
+        elif isinstance(item, QComboBox):
+            setattr(self.config, tag, item.currentData())
+        elif isinstance(item, QCheckBox):
+            state = item.checkState() == Qt.CheckState.Checked
+            setattr(self.config, tag, state)
+        elif isinstance(item, QTableWidget):
+            dictionary = getattr(self.config, tag)
+            assert(isinstance(dictionary, dict))
+            key = args.data(Qt.ItemDataRole.UserRole)
+            value = args.text()
+            print(f"key {key} value {value}")
+            dictionary[key] = value
+            setattr(self.config, tag, dictionary)
+        else:
+            raise AttributeError(f"No config handler for {tag} / {item}")
+
+        match tag:
+            case "serial_port":
+                self.btn_connect_serial.setEnabled(item.currentData() is not None)
+
+        self.config_changed.emit(self.config, tag)
+
+    def config_reloaded(self, keys: list, trackers: list):
+        """Show Config values that were changed outside the form"""
+        for tag in keys:
+            item = self.findChild(QWidget, tag)
+            if item is None:
+                continue
+            value = getattr(self.config, tag)
+            item.blockSignals(True)
+            if isinstance(item, QSpinBox) or \
+               isinstance(item, QDoubleSpinBox):
+                item.setValue(value)
+            elif isinstance(item, QLineEdit):
+                item.setText(value)
+            elif isinstance(item, QComboBox):
+                item.setCurrentIndex(item.findData(value))
+            elif isinstance(item, QCheckBox):
+                item.setCheckState(Qt.CheckState.Checked if value else Qt.CheckState.Unchecked)
+            item.blockSignals(False)
+
+    def update_trigger(self, channel: int, axis: int, direction: int, level: float, enabled: bool):
+        self.config.levels[channel][axis * 2 + direction] = level if enabled else inf if direction == 0 else -inf
+
+    def save_clicked(self):
+        # print(self.config.dump())
+        self.config.save(self.config_path)
+        self.config_saved.emit()
+
+    def serial_refresh_ports(self):
+        # Enumerating ports can take a while, keep it off the GUI thread
+        self.port_worker = Worker(list_usb_ports)
+        self.port_worker.signals.result.connect(self.serial_ports_listed)
+        QThreadPool.globalInstance().start(self.port_worker)
+
+    def serial_ports_listed(self, ports: list):
+        currentPort = self.combo_serial.currentData()
+        # Refilling the list isn't a config change, a port that's unplugged stays configured
+        self.combo_serial.blockSignals(True)
+        self.combo_serial.clear()
+        for name, device in ports:
+            self.combo_serial.addItem(name, device)
+        # A given or configured port that isn't USB, like the pty of emulator.py
+        for extra in [self.port_override, self.config.serial_port]:
+            if extra and self.combo_serial.findData(extra) == -1 and os.path.exists(extra):
+                self.combo_serial.addItem(extra, extra)
+
+        currentIndex = self.combo_serial.findData(currentPort)
+        if currentIndex == -1:
+            currentIndex = self.combo_serial.findData(self.port_override or self.config.serial_port)
+        self.combo_serial.setCurrentIndex(currentIndex)
+        self.combo_serial.blockSignals(False)
+
+        port = self.combo_serial.currentData()
+        self.btn_connect_serial.setEnabled(port is not None)
+        if port is not None and port != self.config.serial_port and port != self.port_override:
+            self.config.serial_port = port
+            self.config_changed.emit(self.config, "serial_port")
+        self.ports_listed.emit()
+
+    def serial_connect_clicked(self):
+        self.combo_serial.setEnabled(False)
+        self.btn_refresh.setEnabled(False)
+        self.btn_connect_serial.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaStop))
+        port = self.combo_serial.currentData()
+        self.serial_connect.emit(port if port is not None else self.config.serial_port)
+
+    def serial_connected(self, connected: bool):
+        if connected:
+            return
+
+        if not self.closing:
+            self.serial_refresh_ports()
+        self.combo_serial.setEnabled(True)
+        self.btn_refresh.setEnabled(True)
+        self.btn_connect_serial.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPlay))
+
+    def osc_connect_clicked(self):
+        self.btn_connect_osc.setEnabled(False)
+        self.btn_connect_osc.setText(self.btn_connect_osc.text() + "ing")
+        self.osc_connect.emit(self.config.osc_ip, self.config.osc_port)
+
+    def osc_connected(self, connected: bool):
+        self.btn_connect_osc.setText("Disconnect" if connected else "Connect")
+        self.btn_connect_osc.setEnabled(True)
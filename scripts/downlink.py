@@ -0,0 +1,120 @@
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Tuple
+
+from packet import Packet, Config
+
+class ConfigDownlink():
+    """
+    Transmitter configs on their way to the receiver.
+
+    Updates to a channel replace what's still pending for it. flush() hands
+    out everything pending as one write, a config counts as acknowledged once
+    the channel reports the same threshold and duration back, and is sent
+    again after `timeout` seconds without, up to `attempts` times.
+
+    A synced channel that reports something else later, because the
+    transmitter rebooted to its built-in config, gets its config again. So
+    does a failed one once it's heard from again, at most every
+    `retry_failed` seconds.
+    """
+    # The receiver (Uno) has a 64 byte serial buffer and reads one config per loop
+    max_write = 60
+    retry_failed = 5.0
+
+    def __init__(self, timeout: float = .5, attempts: int = 5):
+        self.timeout = timeout
+        self.attempts = attempts
+        self.lock = Lock()
+        self.pending : Dict[int, Config] = {}
+        self.inflight : Dict[int, Tuple[Config, float, int]] = {} # channel: (config, sent, attempts)
+        self.state : Dict[int, str] = {}
+        self.wanted : Dict[int, Config] = {} # Last config put per channel
+        self.failed : Dict[int, float] = {} # channel: when it was given up on
+        self.sent = 0
+        self.retries = 0
+        self.resent = 0 # Configs queued again for a channel that lost it
+
+    def put(self, config: Config):
+        with self.lock:
+            self.pending[config.channel] = config
+            self.wanted[config.channel] = config
+            self.state[config.channel] = "pending"
+
+    def flush(self, now: float = None) -> bytes:
+        """Bytes to write: pending configs first, then retries that are due"""
+        if not self.pending and not self.inflight:
+            return b""
+        now = monotonic() if now is None else now
+        with self.lock:
+            writes : List[Tuple[Config, int]] = [(config, 0) for config in self.pending.values()]
+            for channel, (config, sent, attempts) in self.inflight.items():
+                if channel in self.pending or now - sent < self.timeout:
+                    continue
+                if attempts >= self.attempts:
+                    self.state[channel] = "failed"
+                    self.failed[channel] = now
+                    continue
+                writes.append((config, attempts))
+
+            writes = writes[:self.max_write // Config.size]
+            self.retries += sum(1 for _, attempts in writes if attempts)
+            for config, attempts in writes:
+                self.pending.pop(config.channel, None)
+                self.inflight[config.channel] = (config, now, attempts + 1)
+            self.inflight = {ch: v for ch, v in self.inflight.items() if self.state[ch] != "failed"}
+            self.sent += len(writes)
+        return b"".join(config.bytes() for config, _ in writes)
+
+    def ack(self, packet: Packet):
+        """Called for every received packet, a lookup and a compare unless its channel's config changes"""
+        wanted = self.wanted.get(packet.id)
+        if wanted is None:
+            return
+        entry = self.inflight.get(packet.id) if self.inflight else None
+        if entry is not None:
+            config = entry[0]
+            if packet.threshold == config.threshold and packet.duration == config.duration:
+                with self.lock:
+                    if self.inflight.get(packet.id) is entry:
+                        del self.inflight[packet.id]
+                        self.state[packet.id] = "synced"
+            return
+
+        if packet.threshold == wanted.threshold and packet.duration == wanted.duration:
+            if self.state.get(packet.id) == "failed":
+                # Got there after all
+                with self.lock:
+                    if self.state.get(packet.id) == "failed":
+                        self.state[packet.id] = "synced"
+            return
+
+        # The transmitter doesn't have its config (any more)
+        state = self.state.get(packet.id)
+        if state == "pending" or state == "failed" and monotonic() - self.failed[packet.id] < self.retry_failed:
+            return
+        with self.lock:
+            if packet.id in self.pending or packet.id in self.inflight or self.wanted.get(packet.id) is not wanted:
+                return
+            self.pending[packet.id] = wanted
+            self.state[packet.id] = "pending"
+            self.resent += 1
+
+    def wait_time(self, now: float = None) -> float:
+        """Seconds until flush() has something to write, None when nothing is waiting"""
+        if self.pending:
+            return 0
+        if not self.inflight:
+            return None
+        now = monotonic() if now is None else now
+        return max(0, min(sent for _, sent, _ in self.inflight.values()) + self.timeout - now)
+
+    def status(self) -> Dict[int, str]:
+        """Per channel: pending, synced or failed"""
+        with self.lock:
+            return dict(self.state)
+
+    def stats(self) -> dict:
+        states = list(self.status().values())
+        return {"synced": states.count("synced"), "pending": states.count("pending"),
+                "failed": states.count("failed"), "retries": self.retries, "resent": self.resent}
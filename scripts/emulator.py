@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Receiver emulator: speaks the serial protocol of src/receiver.cpp on a pty,
+so SensorInterface and the rest of the host can run without the hardware.
+
+Run from the scripts folder, e.g. `./emulator.py --channels 18 --rate 500`,
+and point voetstappen.py at the printed port with --port.
+"""
+import os
+import pty
+import random
+import select
+import struct
+import threading
+import tty
+from math import exp
+from time import monotonic, sleep
+from typing import Dict, List
+
+from packet import Packet, Config
+
+class Transmitter():
+    """One emulated tracker as seen through the receiver"""
+    # conf_t config in transmitter.cpp, what setup() applies and reports
+    boot_threshold = 20
+    boot_duration = 10
+
+    def __init__(self, channel: int, boot: float, drift: float = 0):
+        self.channel = channel
+        self.boot = boot
+        self.clock_rate = 1 - drift * 1e-6 # Crystal error, ppm slow
+        self.next_frame = boot
+        self.threshold = self.boot_threshold
+        self.duration = self.boot_duration
+        self.cfg_update = 0
+        self.ack_payload : Config = None # Queued on the receiver, goes out with the next ack
+        self.motion = 0
+        self.motion_time = 0
+        self.last_step = -1.0
+        self.step_pending = False
+        self.silent_until = 0.0
+
+    def restart(self, now: float):
+        """Back to how setup() leaves it, config included"""
+        self.boot = now
+        self.threshold, self.duration = self.boot_threshold, self.boot_duration
+        self.cfg_update = 0
+        self.ack_payload = None
+        self.motion = 0
+        self.motion_time = 0
+        self.step_pending = False
+
+    def millis(self, now: float) -> int:
+        return int((now - self.boot) * 1000 * self.clock_rate) & 0xffffffff
+
+class ReceiverEmulator():
+    """
+    `channels` transmitters sending keepalives at `rate` Hz each, plus a frame
+    for every step. Steps follow `pattern`: "walk" alternates the two channels
+    of each tracker every `step_interval` s, "random" gives every channel
+    steps at random with that mean interval, "none" has no steps.
+
+    Faults: `noise` bursts of random bytes per second, `corrupt` fraction of
+    frames with a flipped bit, `loss` fraction of frames lost over the radio,
+    `duplicate` fraction forwarded twice, `reboot` transmitter restarts per
+    channel per second and `dropout` silences per channel per second, each
+    `dropout_length` s long. `baud` caps the link like the real serial
+    port does (0 for no cap), frames over the cap are lost. Transmitter
+    clocks are off by up to `drift` ppm.
+
+    Configs written to the port are handled like the firmware does: queued
+    as ack payload, applied by the transmitter after its next frame and
+    reported with cfg_update set in the frame after that.
+    """
+    patterns = ["walk", "random", "none"]
+    tick = .002
+    step_length = .05 # s of acceleration per step
+
+    def __init__(self, channels: int = 18, rate: float = 100, pattern: str = "walk",
+                 step_interval: float = .6, noise: float = 0, noise_length: int = 32,
+                 corrupt: float = 0, loss: float = 0, duplicate: float = 0, reboot: float = 0,
+                 dropout: float = 0, dropout_length: float = 1,
+                 baud: int = 0, drift: float = 0, first_channel: int = 1, seed: int = None):
+        if pattern not in self.patterns:
+            raise ValueError(f"Unknown step pattern {pattern}, expected one of {self.patterns}")
+        self.random = random.Random(seed)
+        self.rate = rate
+        self.pattern = pattern
+        self.step_interval = step_interval
+        self.noise = noise
+        self.noise_length = noise_length
+        self.corrupt = corrupt
+        self.loss = loss
+        self.duplicate = duplicate
+        self.reboot = reboot
+        self.dropout = dropout
+        self.dropout_length = dropout_length
+        self.baud = baud
+
+        now = monotonic()
+        self.transmitters : Dict[int, Transmitter] = {
+            ch: Transmitter(ch, now - self.random.random() * 100, self.random.uniform(-drift, drift))
+            for ch in range(first_channel, first_channel + channels)}
+        for tx in self.transmitters.values():
+            tx.next_frame = now + self.random.random() / rate if rate > 0 else now
+        self.next_step = now + step_interval
+        self.walk_offset = 0
+        self.link_budget = 0.0
+        self.downlink = b""
+
+        self.running = False
+        self.master = None
+        self.port = None
+        self.thread = None
+        self.frames = 0
+        self.lost = 0
+        self.radio_lost = 0
+        self.silenced = 0
+        self.duplicates = 0
+        self.reboots = 0
+        self.configs = 0
+        self.bad_configs = 0
+
+    def open(self) -> str:
+        """Creates the pty, returns the port to open"""
+        self.master, slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self.slave = slave # Keeps the pty alive between host connections
+        return self.port
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+    def start(self) -> str:
+        """Runs the emulator in a background thread, returns the port to open"""
+        port = self.open()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="ReceiverEmulator", daemon=True)
+        self.thread.start()
+        return port
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        self.close()
+
+    def run(self):
+        self.running = True
+        last = monotonic()
+        while self.running:
+            now = monotonic()
+            self.receive()
+            out = self.frames_due(now)
+            if self.baud:
+                self.link_budget = min(self.link_budget + (now - last) * self.baud / 10, self.baud / 10 * .1)
+                keep = int(self.link_budget) // Packet.size * Packet.size
+                self.lost += (len(out) - min(len(out), keep)) // Packet.size
+                out = out[:keep]
+                self.link_budget -= len(out)
+            if self.noise and self.random.random() < 1 - exp(-self.noise * (now - last)):
+                out += self.random.randbytes(self.random.randint(1, self.noise_length))
+            last = now
+            if out:
+                self.write(out)
+            sleep(self.tick)
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while view and self.running:
+            _, writable, _ = select.select([], [self.master], [], .1)
+            if writable:
+                n = os.write(self.master, view)
+                view = view[n:]
+
+    def frames_due(self, now: float) -> bytes:
+        self.schedule_steps(now)
+        frames : List[bytes] = []
+        interval = 1 / self.rate if self.rate > 0 else None
+        for tx in self.transmitters.values():
+            if self.reboot and self.random.random() < 1 - exp(-self.reboot * self.tick):
+                self.reboots += 1
+                tx.restart(now)
+                tx.silent_until = now + .3 # Sensor and radio setup
+            if self.dropout and self.random.random() < 1 - exp(-self.dropout * self.tick):
+                tx.silent_until = now + self.dropout_length
+            if now < tx.silent_until:
+                while interval and tx.next_frame <= now:
+                    self.silenced += 1
+                    tx.next_frame += interval
+                tx.step_pending = False
+                continue
+            if tx.step_pending:
+                # A step is sent right away instead of waiting for the keepalive
+                self.send(tx, tx.last_step, frames)
+                tx.step_pending = False
+                if interval:
+                    tx.next_frame = now + interval
+            while interval and tx.next_frame <= now:
+                self.send(tx, tx.next_frame, frames)
+                tx.next_frame += interval
+        self.frames += len(frames)
+        if self.baud:
+            # Frames over the cap are cut from the end, spread that over all channels
+            self.random.shuffle(frames)
+        return b"".join(frames)
+
+    def send(self, tx: Transmitter, when: float, frames: List[bytes]):
+        """A frame over the radio, the receiver forwards it unless it's lost"""
+        if self.loss and self.random.random() < self.loss:
+            # Not acknowledged, so no ack payload either. The firmware doesn't resend.
+            self.radio_lost += 1
+            return
+        frame = self.frame(tx, when)
+        frames.append(frame)
+        if self.duplicate and self.random.random() < self.duplicate:
+            # The ack got lost and the retry went through too
+            frames.append(frame)
+            self.duplicates += 1
+
+    def schedule_steps(self, now: float):
+        if self.pattern == "none":
+            return
+        if self.pattern == "walk":
+            # Every tracker steps together, left and right foot in turn
+            while self.next_step <= now:
+                for tx in self.transmitters.values():
+                    if (tx.channel - 1) % 2 == self.walk_offset:
+                        self.step(tx, self.next_step)
+                self.walk_offset ^= 1
+                self.next_step += self.step_interval
+        else:
+            p = 1 - exp(-self.tick / self.step_interval)
+            for tx in self.transmitters.values():
+                if self.random.random() < p:
+                    self.step(tx, now)
+
+    def step(self, tx: Transmitter, when: float):
+        tx.last_step = when
+        tx.step_pending = True
+        tx.motion_time = tx.millis(when)
+        tx.motion = 1 << (Packet.motion_shift + self.random.randrange(len(Packet.motion_keys)))
+
+    def frame(self, tx: Transmitter, when: float) -> bytes:
+        since_step = when - tx.last_step
+        impulse = 12000 * (1 - since_step / self.step_length) if 0 <= since_step < self.step_length else 0
+        acc = [int(self.random.gauss(0, 150)) for _ in range(3)]
+        acc[2] += 16384 + int(impulse) # 1 g at the +-2 g range mpu.initialize() sets, plus the step
+        acc = [max(-32768, min(32767, a)) for a in acc]
+
+        data = bytearray(struct.pack(Packet.format, 0xE1BA, tx.channel, tx.millis(when), tx.motion_time,
+                                     *acc, tx.motion, tx.cfg_update, tx.threshold, tx.duration, 0))
+        data[-1] = sum(data[2:-1]) & 0xff
+
+        # The receiver sends its queued config as the ack payload for this frame
+        tx.cfg_update = 0
+        if tx.ack_payload:
+            tx.threshold, tx.duration = tx.ack_payload.threshold, tx.ack_payload.duration
+            tx.cfg_update = 0b11
+            tx.ack_payload = None
+
+        if self.corrupt and self.random.random() < self.corrupt:
+            bit = self.random.randrange(len(data) * 8)
+            data[bit // 8] ^= 1 << (bit % 8)
+        return bytes(data)
+
+    def receive(self):
+        """Reads packet_conf_t configs from the host like receive_config()"""
+        while select.select([self.master], [], [], 0)[0]:
+            self.downlink += os.read(self.master, 1024)
+        while len(self.downlink) >= Config.size:
+            conf, self.downlink = self.downlink[:Config.size], self.downlink[Config.size:]
+            if conf[0] != 0xE1 or conf[1] != 0xBA or sum(conf[:-1]) & 0xff != conf[-1]:
+                # The firmware drops all it has buffered after a bad config
+                self.bad_configs += 1
+                self.downlink = b""
+                break
+            tx = self.transmitters.get(conf[2])
+            if tx:
+                self.configs += 1
+                tx.ack_payload = Config(conf[2], conf[3], conf[4])
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "lost": self.lost, "radio lost": self.radio_lost, "silenced": self.silenced,
+                "duplicates": self.duplicates, "reboots": self.reboots,
+                "configs": self.configs, "bad configs": self.bad_configs}
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=18, help="3 radios x 6 pipes on the real receiver")
+    parser.add_argument("--rate", type=float, default=100, help="keepalive frames per second per channel")
+    parser.add_argument("--pattern", choices=ReceiverEmulator.patterns, default="walk")
+    parser.add_argument("--step-interval", type=float, default=.6, help="s between steps")
+    parser.add_argument("--noise", type=float, default=0, help="bursts of garbage bytes per second")
+    parser.add_argument("--corrupt", type=float, default=0, help="fraction of frames with a flipped bit")
+    parser.add_argument("--loss", type=float, default=0, help="fraction of frames lost over the radio")
+    parser.add_argument("--duplicate", type=float, default=0, help="fraction of frames forwarded twice")
+    parser.add_argument("--reboot", type=float, default=0, help="transmitter reboots per channel per second")
+    parser.add_argument("--dropout", type=float, default=0, help="dropouts per channel per second")
+    parser.add_argument("--dropout-length", type=float, default=1, help="s per dropout")
+    parser.add_argument("--baud", type=int, default=0, help="cap the link like a real port, e.g. 115200")
+    parser.add_argument("--drift", type=float, default=0, help="max transmitter clock error in ppm")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    emulator = ReceiverEmulator(args.channels, args.rate, args.pattern, args.step_interval, args.noise,
+                                corrupt=args.corrupt, loss=args.loss, duplicate=args.duplicate,
+                                reboot=args.reboot, dropout=args.dropout, dropout_length=args.dropout_length,
+                                baud=args.baud, drift=args.drift, seed=args.seed)
+    print(f"Receiver emulator on {emulator.open()}, Ctrl-C to stop")
+    thread = threading.Thread(target=emulator.run, daemon=True)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(5)
+            print(" ".join(f"{k}: {v}" for k, v in emulator.stats().items()))
+    except KeyboardInterrupt:
+        emulator.running = False
+        thread.join()
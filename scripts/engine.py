@@ -0,0 +1,210 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+
+import time
+from time import monotonic, perf_counter_ns
+from clock import ClockSync
+from config import Config, TrackerConfig
+from link import LinkStats
+from packet import Packet
+from rate import EwmaRateCounter
+from threading import Lock
+from typing import Callable, Dict, List, Tuple
+
+class ChannelState():
+    """What happened on a channel since the GUI last looked"""
+    __slots__ = ("packet", "frames", "motion", "cfg_update")
+
+    def __init__(self):
+        self.packet : Packet = None
+        self.frames = 0
+        self.motion = 0 # Packet.motion_bits
+        self.cfg_update = False
+
+class Snapshot():
+    """
+    Latest state per channel, written by the reader thread for every packet
+    and pulled by the GUI on its own frame clock. Motion is latched between
+    pulls so a short flash is never lost.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.channels : Dict[int, ChannelState] = {}
+        self.motion_times : Dict[int, int] = {}
+        self.rates : Dict[int, EwmaRateCounter] = {}
+
+    def update(self, packet: Packet):
+        rate = self.rates.get(packet.id)
+        if rate is None:
+            rate = self.rates[packet.id] = EwmaRateCounter(20)
+        rate.event()
+
+        new_motion = self.motion_times.get(packet.id) != packet.motion_time
+        self.motion_times[packet.id] = packet.motion_time
+
+        with self.lock:
+            state = self.channels.get(packet.id)
+            if state is None:
+                state = self.channels[packet.id] = ChannelState()
+            state.packet = packet
+            state.frames += 1
+            state.cfg_update |= bool(packet.cfg_update)
+            if new_motion:
+                state.motion |= packet.motion_bits
+
+    def take(self) -> Dict[int, ChannelState]:
+        with self.lock:
+            channels, self.channels = self.channels, {}
+        return channels
+
+    def rate(self, channel: int) -> EwmaRateCounter:
+        rate = self.rates.get(channel)
+        if rate is None:
+            rate = self.rates[channel] = EwmaRateCounter(20)
+        return rate
+
+class FilterEngine():
+    """
+    Cue detection for all trackers, independent of the GUI.
+
+    process() is called from the SensorInterface reader thread. Cues go
+    straight to the registered sinks (e.g. OscClient.send_cue) from that
+    thread; the GUI only hears about them through the queued TrackerFilter.cue
+    signal and reads everything else from the snapshot.
+    """
+    def __init__(self, config: Config):
+        self.config = config
+        self.filters = [TrackerFilter(tracker) for tracker in config.trackers]
+        self.cue_sinks : List[Callable[[str, float, tuple], None]] = []
+        self.routes : Dict[int, Tuple[TrackerFilter, int, int]] = {}
+        self.snapshot = Snapshot()
+        # Per channel, transmitter millis() to host monotonic time
+        self.clocks : Dict[int, ClockSync] = {}
+        self.links : Dict[int, LinkStats] = {}
+        self.detector = None
+        self.use_bits = True
+        self.configure_detector()
+        self.rebuild_routes()
+
+    def rebuild_routes(self):
+        """Map each channel to its filter, channel offset and tracker index"""
+        routes = {}
+        for i, (tracker, tracker_filter) in enumerate(zip(self.config.trackers, self.filters)):
+            for offset, ch in enumerate(tracker.channels):
+                if ch in routes:
+                    print(f"Channel {ch} assigned more than once, only tracker {routes[ch][2]} gets its packets")
+                    continue
+                routes[ch] = (tracker_filter, offset, i)
+        # Swapped in one go, the reader thread never sees a half-built table
+        self.routes = routes
+
+    def rebuild_filters(self):
+        """Filters for the trackers in the config, keeping those of trackers that are still there"""
+        kept = {id(f.config): f for f in self.filters}
+        self.filters = [kept.get(id(tracker)) or TrackerFilter(tracker) for tracker in self.config.trackers]
+        self.rebuild_routes()
+
+    def configure_detector(self):
+        """Apply Config.accel_*, numpy is only loaded once the detector is turned on"""
+        mode = self.config.accel_mode
+        if mode not in ("off", "either", "only"):
+            print(f"Unknown accel_mode {mode}, host-side detection is off")
+            mode = "off"
+        if mode == "off":
+            self.detector = None
+        elif self.detector is None:
+            from accel import AccelDetector
+            self.detector = AccelDetector(self.config.accel_jerk, self.config.accel_energy)
+        else:
+            self.detector.configure(self.config.accel_jerk, self.config.accel_energy)
+        self.use_bits = mode != "only"
+
+    def link_stats(self) -> Dict[int, dict]:
+        """Per channel frames, lost frames, gaps, missed motions, reboots and duplicates, see LinkStats"""
+        return {ch: link.to_dict() for ch, link in sorted(self.links.items())}
+
+    def add_sink(self, sink: Callable[[str, float, tuple], None]):
+        # Copy on write, process() may be iterating the list in another thread
+        self.cue_sinks = self.cue_sinks + [sink]
+
+    def remove_sink(self, sink: Callable[[str, float, tuple], None]):
+        self.cue_sinks = [s for s in self.cue_sinks if s != sink]
+
+    def process(self, packet: Packet, trace: tuple = None, accel_bits: int = 0):
+        """
+        `trace` holds LatencyMonitor timestamps of the packet, passed on to
+        the sinks with the cue. `accel_bits` is what the detector found in it.
+        """
+        self.snapshot.update(packet)
+        clock = self.clocks.get(packet.id)
+        if clock is None:
+            clock = self.clocks[packet.id] = ClockSync()
+            self.links[packet.id] = LinkStats()
+        clock.update(packet.sensor_time, monotonic())
+        self.links[packet.id].update(packet.sensor_time, packet.motion_time)
+        route = self.routes.get(packet.id)
+        if route is None:
+            return
+        tracker_filter, offset, _ = route
+        if tracker_filter.process(packet, offset, clock, accel_bits, self.use_bits):
+            if trace is not None:
+                trace += (perf_counter_ns(),)
+            # Sinks get the motion time on the wall clock, for OSC timetags
+            cue_time = tracker_filter.cue_last_time + time.time() - monotonic()
+            for sink in self.cue_sinks:
+                sink(tracker_filter.config.cue, cue_time, trace)
+
+class TrackerFilter(QObject):
+    cue = pyqtSignal(str, object, int) # cue, filter, channel offset
+
+    def __init__(self, config: TrackerConfig):
+        super(TrackerFilter, self).__init__()
+        self.rate = EwmaRateCounter(100)
+        self.config = config
+
+        # self.update_config(config, "filter_")
+        self.last_motion_times = {}
+        self.cue_last_time = -1000
+        self.last_offset = -1
+
+        # self.timeout.connect(self.emit)
+        self.start_time = time.time()
+
+    def process(self, packet: Packet, offset: int, clock: ClockSync = None,
+                accel_bits: int = 0, use_bits: bool = True) -> bool:
+        """
+        Motion comes from a new motion_time with the bits of the enabled axes
+        set (unless not `use_bits`), or else from the host-side detector's
+        `accel_bits` for this frame. Spacing is timed on when the motion
+        happened according to the channel's `clock`, or on when it arrived
+        while that isn't synced.
+        """
+        sensor_time = None
+        if(packet.motion_time != self.last_motion_times.get(packet.id, 0)):
+            self.last_motion_times[packet.id] = packet.motion_time
+            if use_bits and packet.motion_bits & Packet.motion_mask(self.config.axes[offset]):
+                sensor_time = packet.motion_time
+        if sensor_time is None and accel_bits and accel_bits & Packet.motion_mask(self.config.axes[offset]):
+            sensor_time = packet.sensor_time
+        if sensor_time is None:
+            return False
+
+        if clock is not None and clock.synced():
+            motion_time = clock.host_time(sensor_time)
+        else:
+            motion_time = monotonic()
+        interval = (motion_time - self.cue_last_time) * 1000
+        # print(f"Motion with interval {interval}")
+        if offset != self.last_offset and interval > self.config.repeat_different:
+            # print("Sending cue for different foot")
+            self.last_offset = offset
+            self.cue_last_time = motion_time
+            self.cue.emit(self.config.cue, self, offset)
+            return True
+        elif offset == self.last_offset and interval > self.config.repeat_same:
+            # print("Sending cue for same foot")
+            self.cue_last_time = motion_time
+            self.cue.emit(self.config.cue, self, offset)
+            return True
+        else:
+            # print("Not sending cue, too fast repeat")
+            return False # One packet can only cause 1 que
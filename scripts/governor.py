@@ -0,0 +1,88 @@
+import heapq
+from time import monotonic
+from typing import List, Tuple
+
+class CueGovernor():
+    """
+    Caps the combined cue rate of all trackers with a token bucket.
+
+    `rate` cues per second on average, at most `burst` at once; a rate of 0
+    disables the limit. Cues over the limit are dropped, or with overflow
+    "delay" deferred (highest priority first) until a token frees up, as long
+    as that happens within `max_delay` ms.
+    """
+    overflow_modes = ["drop", "delay"]
+
+    def __init__(self, rate: float, burst: int, overflow: str = "drop", max_delay: int = 1000):
+        self.deferred : List[Tuple[int, int, float, tuple]] = [] # (-priority, seq, time, item)
+        self.seq = 0
+        self.dropped = 0
+        self.delayed = 0
+        self.configure(rate, burst, overflow, max_delay)
+        self.tokens = float(self.burst)
+        self.last = monotonic()
+
+    def configure(self, rate: float, burst: int, overflow: str, max_delay: int):
+        if overflow not in self.overflow_modes:
+            print(f"Unknown cue overflow mode {overflow}, dropping cues over the limit")
+            overflow = "drop"
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.overflow = overflow
+        self.max_delay = max_delay / 1000
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def admit(self, items: List[tuple], priorities: List[int]) -> List[tuple]:
+        """The items to send now, deferred cues that are due included"""
+        if self.rate <= 0:
+            return self.release_all() + items
+
+        now = monotonic()
+        self.refill(now)
+        allowed = self.release(now)
+
+        for priority, item in sorted(zip(priorities, items), key=lambda p: -p[0]):
+            if self.tokens >= 1:
+                self.tokens -= 1
+                allowed.append(item)
+            elif self.overflow == "delay":
+                self.seq += 1
+                self.delayed += 1
+                heapq.heappush(self.deferred, (-priority, self.seq, now, item))
+            else:
+                self.dropped += 1
+        return allowed
+
+    def release(self, now: float) -> List[tuple]:
+        allowed = []
+        while self.deferred:
+            _, _, queued, item = self.deferred[0]
+            if now - queued > self.max_delay:
+                heapq.heappop(self.deferred)
+                self.dropped += 1
+            elif self.tokens >= 1:
+                heapq.heappop(self.deferred)
+                self.tokens -= 1
+                allowed.append(item)
+            else:
+                break
+        return allowed
+
+    def release_all(self) -> List[tuple]:
+        allowed = [item for _, _, _, item in sorted(self.deferred)]
+        self.deferred.clear()
+        return allowed
+
+    def wait_time(self) -> float:
+        """Seconds until a deferred cue can go out, None when nothing is deferred"""
+        if not self.deferred:
+            return None
+        if self.rate <= 0:
+            return 0
+        return max(.001, (1 - self.tokens) / self.rate - (monotonic() - self.last))
+
+    def stats(self) -> dict:
+        return {"dropped": self.dropped, "deferred": self.delayed, "waiting": len(self.deferred)}
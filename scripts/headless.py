@@ -0,0 +1,341 @@
+from PyQt6.QtCore import QCoreApplication, QFileSystemWatcher, QObject, QThreadPool, QTimer, pyqtSignal
+import signal
+import traceback
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List
+
+from config import Config
+from packet import Config as PacketConfig
+from engine import FilterEngine
+
+class Pipeline(QObject):
+    """
+    Serial interface, filter engine and OSC client without any widgets.
+
+    Runs on its own under a QCoreApplication (voetstappen.py --headless), or
+    with MainWindow attached as a viewer and editor on top of it.
+    """
+    serial_connected = pyqtSignal(bool)
+    osc_connected = pyqtSignal(bool)
+    config_reloaded = pyqtSignal(list, list) # changed Config keys, changed tracker indices
+    trackers_reloaded = pyqtSignal() # trackers added or removed
+
+    def __init__(self, config: Config, record: str = None, replay: str = None, speed: float = 1.0,
+                 use_asyncio: bool = False, latency: str = None, port: str = None):
+        """
+        With `latency` set, per-stage latencies are recorded and saved to that
+        JSON file on close(). `port` is used instead of Config.serial_port for
+        this run only, it never ends up in the config file.
+        """
+        super().__init__()
+        self.config = config
+        self.port = port
+        self.record = record
+        self.replay = replay
+        self.replay_speed = speed
+
+        self.threadpool = QThreadPool()
+        # The serial and OSC workers each hold a thread for as long as they run
+        self.threadpool.setMaxThreadCount(max(self.threadpool.maxThreadCount(), 4))
+        # Serial, OSC and asyncio modules are imported when first needed
+        self.core = None
+        if use_asyncio:
+            from aio import AsyncCore
+            self.core = AsyncCore()
+        self.interface = None
+        self.osc_client = None
+
+        # Cue detection, runs in the interface thread
+        self.engine = FilterEngine(self.config)
+
+        self.latency_path = latency
+        self.latency_monitor = None
+        if latency:
+            from latency import LatencyMonitor
+            self.latency_monitor = LatencyMonitor()
+
+        self.config_path = None
+        self.saved_digest = None # Of what the app itself last wrote to config_path
+        self.watcher = None
+        # Editors write in bursts (truncate, write, rename), reload once it settles
+        self.timer_reload = QTimer()
+        self.timer_reload.setSingleShot(True)
+        self.timer_reload.setInterval(100)
+        self.timer_reload.timeout.connect(self.reload_config)
+
+    def serial_connect(self, port: str):
+        if self.interface is None:
+            if self.replay:
+                port = self.replay
+            print(f"Connecting to {port}")
+            if not port:
+                print("No interface selected")
+                self.serial_connected.emit(False)
+                return
+
+            # A recording has no file descriptor to wait on, replay always gets a thread
+            if self.core and not self.replay:
+                from aio import AsyncSensorInterface as interface_class
+            else:
+                from interface import SensorInterface as interface_class
+            self.interface = interface_class(port, self.engine, self.record,
+                                             self.replay_speed if self.replay else None)
+            self.interface.latency_monitor = self.latency_monitor
+            self.interface.signals.finished.connect(self.on_serial_disconnect)
+            self.start_worker(self.interface)
+            self.send_tracker_config()
+            self.serial_connected.emit(True)
+        else:
+            print("Stopping")
+            self.interface.stop()
+
+    def start_worker(self, worker):
+        if self.core and hasattr(worker, "start_async"):
+            self.core.start(worker)
+        else:
+            self.threadpool.start(worker)
+
+    def send_tracker_config(self):
+        for tracker in self.config.trackers:
+            for i, ch in enumerate(tracker.channels):
+                cfg = PacketConfig(ch, tracker.threshold[i], tracker.duration[i])
+                print(f"Sending config to tracker of channel {ch} [{cfg}]")
+                self.update_tracker_config(cfg)
+
+    def update_tracker_config(self, config: PacketConfig):
+        if self.interface:
+            self.interface.update_config(config)
+
+    def on_serial_disconnect(self):
+        print("Sensor interface disconnected")
+        self.interface = None
+        self.serial_connected.emit(False)
+
+    def osc_connect(self):
+        if self.osc_client is None:
+            if self.core:
+                from aio import AsyncOscClient as client_class
+            else:
+                from osc_client import OscClient as client_class
+            self.osc_client = client_class(self.config)
+            self.osc_client.latency_monitor = self.latency_monitor
+            self.osc_client.signals.finished.connect(self.on_osc_disconnect)
+            self.engine.add_sink(self.osc_client.send_cue)
+            self.start_worker(self.osc_client)
+            self.osc_connected.emit(True)
+
+        else:
+            print("Stopping osc client")
+            self.osc_client.stop()
+
+    def on_osc_disconnect(self):
+        print(f"OSC disconnected")
+        self.engine.remove_sink(self.osc_client.send_cue)
+        self.osc_client = None
+        self.osc_connected.emit(False)
+
+    def config_changed(self, config: Config, tag: str):
+        if tag.startswith("accel_"):
+            self.engine.configure_detector()
+        if self.osc_client:
+            self.osc_client.update_config(config, tag)
+
+    def compile_cues(self):
+        if self.osc_client:
+            self.osc_client.compile_cues(self.config)
+
+    def watch_config(self, path: str):
+        """Reload the config whenever the file at `path` changes"""
+        self.config_path = Path(path).resolve()
+        self.watcher = QFileSystemWatcher()
+        # The directory too, an atomic save replaces the file and the watch on it goes with it
+        self.watcher.addPath(str(self.config_path.parent))
+        self.watcher.addPath(str(self.config_path))
+        self.watcher.fileChanged.connect(self.config_file_changed)
+        self.watcher.directoryChanged.connect(self.config_file_changed)
+
+    def config_file_changed(self, path: str):
+        if str(self.config_path) not in self.watcher.files() and self.config_path.exists():
+            self.watcher.addPath(str(self.config_path))
+        self.timer_reload.start()
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        import hashlib
+        return hashlib.sha1(data).hexdigest()
+
+    def config_saved(self):
+        """The app saved the config, the change that shows up in the file is its own"""
+        if self.config_path is not None and self.config_path.exists():
+            self.saved_digest = self.digest(self.config_path.read_bytes())
+
+    def reload_config(self):
+        if not self.config_path.exists():
+            return
+        try:
+            # Reloading our own save would undo edits made since
+            if self.digest(self.config_path.read_bytes()) == self.saved_digest:
+                return
+            # All or nothing, a bad value rejects the file before anything live changes
+            new = Config.read(self.config_path, strict=True)
+        except Exception as e:
+            print(f"Not reloading {self.config_path}: {e}")
+            return
+
+        start = perf_counter()
+        resized = len(new.trackers) != len(self.config.trackers)
+        try:
+            keys, trackers, radio = self.apply_config(new)
+        except Exception:
+            # Raising out of a Qt slot would end the app
+            traceback.print_exc()
+            return
+        if not (keys or trackers):
+            return
+        print(f"Reloaded {self.config_path.name} in {(perf_counter() - start) * 1000:.2f} ms: "
+              f"{', '.join(keys + [f'tracker {i}' for i in trackers])}, "
+              f"{len(radio)} channel(s) reconfigured")
+        self.config_reloaded.emit(keys, trackers)
+        if resized:
+            self.trackers_reloaded.emit()
+
+    def apply_config(self, new: Config):
+        """
+        Brings the live config in line with `new`, changing only what differs.
+        Returns the changed Config keys, the indices of changed trackers and the
+        transmitter configs sent for them.
+        """
+        keys = []
+        current = self.config.to_dict()
+        for k, v in new.to_dict().items():
+            if k != "trackers" and current[k] != v:
+                setattr(self.config, k, getattr(new, k))
+                keys.append(k)
+                if self.osc_client:
+                    self.osc_client.update_config(self.config, k)
+        if any(k.startswith("accel_") for k in keys):
+            self.engine.configure_detector()
+        if self.osc_client and {"osc_ip", "osc_port", "osc_targets"} & set(keys):
+            print("OSC destinations changed, reconnect OSC to use them")
+
+        live = self.config.trackers
+        trackers : List[int] = []
+        radio : List[PacketConfig] = []
+        routing = cues = False
+        for i, tracker in enumerate(new.trackers):
+            if i >= len(live):
+                trackers.append(i)
+                radio.extend(PacketConfig(ch, tracker.threshold[o], tracker.duration[o])
+                             for o, ch in enumerate(tracker.channels))
+                continue
+
+            current = live[i]
+            if current.__dict__ == tracker.__dict__:
+                continue
+            trackers.append(i)
+            # Only channels with a new channel number, threshold or duration go out over the radio
+            for o, ch in enumerate(tracker.channels):
+                if o >= len(current.channels) or \
+                   (ch, tracker.threshold[o], tracker.duration[o]) != \
+                   (current.channels[o], current.threshold[o], current.duration[o]):
+                    radio.append(PacketConfig(ch, tracker.threshold[o], tracker.duration[o]))
+            routing |= current.channels != tracker.channels
+            cues |= (current.cue, current.targets, current.priority) != (tracker.cue, tracker.targets, tracker.priority)
+            # In place, the filter holds on to this TrackerConfig
+            current.__dict__.update(tracker.__dict__)
+
+        resized = len(new.trackers) != len(live)
+        if resized:
+            trackers.extend(range(len(new.trackers), len(live)))
+            self.config.trackers = live[:len(new.trackers)] + new.trackers[len(live):]
+            self.engine.rebuild_filters()
+        elif routing:
+            self.engine.rebuild_routes()
+        # The transmitters first, they don't depend on anything else going through
+        for cfg in radio:
+            self.update_tracker_config(cfg)
+        if cues or resized:
+            self.compile_cues()
+        return keys, trackers, radio
+
+    def running(self) -> bool:
+        return self.interface is not None or self.osc_client is not None
+
+    def status(self) -> str:
+        status = []
+        if self.interface:
+            status.append(f"interface: [{self.interface.rate():5.2f}Hz]")
+        if self.latency_monitor:
+            status.append("latency " + self.latency_monitor.summary())
+        if self.osc_client:
+            status.append("osc delay " + " ".join([f"{name}: [{avg:.2f}/{peak:.2f} ms]"
+                                                   for name, (avg, peak) in self.osc_client.latency_ms().items()]))
+            status.append("cues " + " ".join([f"{k}: {v}" for k,v in self.osc_client.governor.stats().items()]))
+            if any(self.osc_client.dropped.values()):
+                status.append("send errors " + " ".join([f"{name}: {n}" for name, n in self.osc_client.dropped.items() if n]))
+        if self.interface:
+            status.append(" ".join([f"{k}: {v}" for k,v in self.interface.decoder.stats().items()]))
+            status.append("config " + " ".join([f"{k}: {v}" for k,v in self.interface.downlink.stats().items()]))
+            links = self.engine.links.values()
+            status.append(f"link lost: {sum(l.lost for l in links)} missed motions: {sum(l.missed_motions for l in links)} "
+                          f"reboots: {sum(l.reboots for l in links)} duplicates: {sum(l.duplicates for l in links)}")
+        return " - ".join(status)
+
+    def link_stats(self) -> Dict[int, dict]:
+        """Per channel radio link counters, see LinkStats"""
+        return self.engine.link_stats()
+
+    def sync_status(self) -> Dict[int, str]:
+        """Per channel whether the transmitter has its config: pending, synced or failed"""
+        return self.interface.downlink.status() if self.interface else {}
+
+    def stop(self):
+        if self.interface:
+            self.interface.stop()
+        if self.osc_client:
+            self.osc_client.stop()
+
+    def save_latency(self):
+        self.latency_monitor.save(self.latency_path)
+        print(f"Latency histograms saved to {self.latency_path}")
+
+    def close(self):
+        if self.core:
+            self.core.close()
+        if self.latency_monitor:
+            self.save_latency()
+
+def run_headless(app: QCoreApplication, pipeline: Pipeline, status_interval: int = 5000) -> int:
+    """Connect serial and OSC, print the status now and then, and quit on Ctrl-C once both are down"""
+    def interrupt(*args):
+        print("Stopping")
+        if not pipeline.running():
+            app.quit()
+        pipeline.stop()
+
+    def disconnected(connected: bool):
+        if not connected and not pipeline.running():
+            app.quit()
+
+    signal.signal(signal.SIGINT, interrupt)
+    signal.signal(signal.SIGTERM, interrupt)
+    pipeline.serial_connected.connect(disconnected)
+    pipeline.osc_connected.connect(disconnected)
+
+    # Lets the interpreter run the signal handlers while Qt waits for events
+    wakeup = QTimer()
+    wakeup.setInterval(200)
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start()
+
+    status = QTimer()
+    status.setInterval(status_interval)
+    status.timeout.connect(lambda: print(pipeline.status()))
+    status.start()
+
+    pipeline.osc_connect()
+    pipeline.serial_connect(pipeline.port or pipeline.config.serial_port)
+    result = app.exec()
+    pipeline.close()
+    return result
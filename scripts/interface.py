@@ -2,85 +2,114 @@ from PyQt6.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
 import sys, traceback
 from worker import WorkerSignals
 
-from packet import Packet, Config
-from queue import Queue
-from rate import RateCounter
+from packet import Packet, Config, FrameDecoder
+from engine import FilterEngine
+from downlink import ConfigDownlink
+from latency import LatencyMonitor
+from rate import EwmaRateCounter
+from recorder import SessionRecorder, ReplayPort
 import serial
 
 class SensorInterface(QRunnable):
-    def __init__(self, port: str):
+    # Set to time reads, decoding and the cues they cause
+    latency_monitor : LatencyMonitor = None
+
+    def __init__(self, port: str, engine: FilterEngine = None,
+                 record: str = None, replay_speed: float = None):
+        """
+        With `replay_speed` set, `port` is a SessionRecorder log to replay instead
+        of a serial port. With `record` set, everything read is appended to that log.
+        """
         super(SensorInterface, self).__init__()
-        self.rate = RateCounter(100)
+        self.engine = engine
+        self.record = record
+        self.replay_speed = replay_speed
+        self.recorder = None
+        self.rate = EwmaRateCounter(100)
         self.portname = port
         self.running = False
         self.signals = WorkerSignals()
-        self.config_q = Queue()
+        self.downlink = ConfigDownlink()
+        # Reads give up after this long without traffic, so configs still go out
+        self.read_timeout = .05
+        self.decoder = FrameDecoder()
         self.debug = False
 
     @pyqtSlot()
     def run(self):
-        last_packet = Packet.random(1, [100,100,100])
         try:
             self.running = True
-            self.port = serial.Serial(self.portname, 115200)
-            self.port.close()
-            self.port.open()
-            self.sync()
+            self.open(self.read_timeout)
 
             while(self.running):
                 if(self.debug):
                     print(self.port.readline())
-                else:
-                    packet = Packet.from_bytes(self.port.read(Packet.size))
-                    if packet is None:
-                        if not self.running:
-                            break
-                        self.sync()
-                    else:
-                        self.rate.event()
-                        self.signals.result.emit(packet)
-
-                if not self.config_q.empty():
-                    cfg = self.config_q.get()
-                    # print(f"Sending config {cfg}")
-                    self.port.write(cfg.bytes())
+                elif self.poll() == 0 and not self.running:
+                    break
 
+                self.write_configs()
 
+        except EOFError as e:
+            print(e)
         except:
             traceback.print_exc()
             exctype, value = sys.exc_info()[:2]
             self.signals.error.emit((exctype, value, traceback.format_exc()))
         finally:
+            if self.recorder:
+                self.recorder.close()
             try:
                 self.signals.finished.emit()
             except RuntimeError:
                 print("SensorInterface not sending finished signal - quitting")
 
-    def sync(self):
-        if self.debug:
-            return
-        tries = 0
-        magic = 0x00
-        packet = None
-        while packet is None and tries < 10:
-            magic_tries = 0
-            while magic != 0xBAE1 and magic_tries < 100:
-                byte = self.port.read(1)
-                if len(byte) != 1:
-                    raise Exception("Couldn't read byte")
-                magic = ((magic << 8) | byte[0]) & 0xFFFF
-                magic_tries += 1
-            if magic != 0xBAE1:
-                raise Exception("Failed to sync to serial port, magic not found")
-            packet = Packet.from_bytes(bytes([0xBA, 0xE1]) + self.port.read(Packet.size - 2))
-            tries += 1
-        if packet is None:
-            raise Exception(f"Failed to sync to serial port after {tries} tries")
-        print(f"Sync done after {tries} attempt(s)")
+    def open(self, timeout: float = None):
+        if self.replay_speed is None:
+            self.port = serial.Serial(self.portname, 115200, timeout=timeout)
+            self.port.close()
+            self.port.open()
+        else:
+            self.port = ReplayPort(self.portname, self.replay_speed)
+        if self.record:
+            self.recorder = SessionRecorder(self.record)
+
+    def poll(self) -> int:
+        """Read what the port has waiting and run all complete frames through the engine"""
+        n = self.decoder.readinto(self.port)
+        monitor = self.latency_monitor
+        if monitor:
+            read = monitor.now()
+        if self.recorder and n > 0:
+            self.recorder.write(self.decoder.view[self.decoder.end - n:self.decoder.end])
+        detector = self.engine.detector if self.engine is not None else None
+        raw = [] if detector is not None else None
+        packets = self.decoder.decode(raw)
+        # One go for all frames of all channels
+        accel = detector.process(b"".join(raw)).tolist() if raw else None
+        trace = None
+        if monitor and packets:
+            decoded = monitor.now()
+            monitor.record("decode", decoded - read)
+            trace = (read, decoded)
+        for i, packet in enumerate(packets):
+            self.rate.event()
+            self.downlink.ack(packet)
+            if self.engine is not None:
+                self.engine.process(packet, trace, accel[i] if accel else 0)
+            else:
+                self.signals.result.emit(packet)
+        return n
 
     def stop(self):
         self.running = False
         self.port.cancel_read()
 
+    def write_configs(self):
+        """All pending transmitter configs and due retries in one write"""
+        data = self.downlink.flush()
+        if data:
+            self.port.write(data)
+
     def update_config(self, config: Config):
-        self.config_q.put(config)
+        # Replaces anything still pending for the channel
+        self.downlink.put(config)
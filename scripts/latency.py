@@ -0,0 +1,121 @@
+import json
+from time import perf_counter_ns
+from typing import Dict, List
+
+class LatencyHistogram():
+    """
+    HDR-style histogram of latencies in us: exact below 32 us, log-linear
+    with 16 buckets per power of two above (within ~6%), so recording is a
+    couple of integer operations and memory stays small whatever the range.
+    """
+    sub_bits = 5
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts : List[int] = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def index(cls, us: int) -> int:
+        shift = us.bit_length() - cls.sub_bits
+        if shift <= 0:
+            return us
+        return (shift << (cls.sub_bits - 1)) + (us >> shift)
+
+    @classmethod
+    def value(cls, index: int) -> int:
+        """Lowest value in the bucket at `index`"""
+        half = 1 << (cls.sub_bits - 1)
+        if index < 2 * half:
+            return index
+        shift = index // half - 1
+        return (index % half + half) << shift
+
+    def record(self, ns: int):
+        us = max(ns, 0) // 1000
+        i = self.index(us)
+        counts = self.counts
+        if i >= len(counts):
+            counts.extend([0] * (i + 1 - len(counts)))
+        counts[i] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p: float) -> int:
+        """Value in us that `p` percent of the recorded latencies don't exceed"""
+        if not self.count:
+            return 0
+        rank = max(1, round(self.count * p / 100))
+        seen = 0
+        for i, n in enumerate(list(self.counts)):
+            seen += n
+            if seen >= rank:
+                return min(self.value(i + 1) - 1, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """Summary in ms and the non-empty buckets as [lowest us, count]"""
+        return {"count": self.count,
+                "mean": self.total / self.count / 1000 if self.count else 0,
+                "p50": self.percentile(50) / 1000,
+                "p90": self.percentile(90) / 1000,
+                "p99": self.percentile(99) / 1000,
+                "max": self.max / 1000,
+                "buckets": [[self.value(i), n] for i, n in enumerate(list(self.counts)) if n]}
+
+class LatencyMonitor():
+    """
+    Per-stage latencies from serial bytes to OSC datagram, on the monotonic
+    clock (perf_counter_ns):
+
+    decode   bytes read until their frames are decoded, per read
+    filter   frame decoded until the filter fired a cue for it
+    enqueue  filter decision until the cue is on the OSC client's queue
+    queue    waiting on the queue, bundle window and cue governor
+    send     the socket send, per OSC target
+    total    bytes read until the datagram is sent, per cue and target
+
+    Workers only time anything when given a monitor, so without one (the
+    default) it costs a None check per read and per cue. A cue carries its
+    timestamps with it as a tuple, see SensorInterface.poll() and
+    OscClient.send_cue().
+    """
+    stages = ["decode", "filter", "enqueue", "queue", "send", "total"]
+
+    def __init__(self):
+        self.histograms : Dict[str, LatencyHistogram] = {stage: LatencyHistogram() for stage in self.stages}
+
+    @staticmethod
+    def now() -> int:
+        return perf_counter_ns()
+
+    def record(self, stage: str, ns: int):
+        self.histograms[stage].record(ns)
+
+    def sent(self, trace: tuple, dispatched: int, sent: int):
+        """Record a cue sent at `sent` ns, trace is (read, decoded, filtered, enqueued)"""
+        read, decoded, filtered, enqueued = trace
+        histograms = self.histograms
+        histograms["filter"].record(filtered - decoded)
+        histograms["enqueue"].record(enqueued - filtered)
+        histograms["queue"].record(dispatched - enqueued)
+        histograms["send"].record(sent - dispatched)
+        histograms["total"].record(sent - read)
+
+    def reset(self):
+        self.histograms = {stage: LatencyHistogram() for stage in self.stages}
+
+    def summary(self, stage: str = "total") -> str:
+        h = self.histograms[stage]
+        return f"{stage} p50/p99/max: [{h.percentile(50) / 1000:.2f}/{h.percentile(99) / 1000:.2f}/{h.max / 1000:.2f} ms]"
+
+    def to_dict(self) -> dict:
+        return {stage: h.to_dict() for stage, h in self.histograms.items()}
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
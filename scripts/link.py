@@ -0,0 +1,85 @@
+class LinkStats():
+    """
+    Radio link quality of one channel, derived from the frames themselves.
+
+    The transmitter sends a frame on every motion and a keepalive when it
+    has been quiet for a while, and never sends a frame again when it's
+    lost. So a gap in sensor_time of well over the usual period means lost
+    frames, a new motion_time in a frame sent well after it means the motion
+    frame itself was lost, sensor_time going back means a reboot and the
+    same sensor_time twice a duplicate.
+    """
+    __slots__ = ("frames", "lost", "gaps", "missed_motions", "reboots", "duplicates",
+                 "last_time", "last_motion_time", "period", "intervals", "loss")
+
+    alpha = .02 # About the last 50 frames
+    warmup = 10 # Intervals to learn the period from before looking for gaps
+    gap_factor = 1.5 # A gap is this many periods without a frame
+    motion_delay = 5 # ms, a motion frame goes out within one transmitter loop
+
+    def __init__(self):
+        self.frames = 0
+        self.lost = 0
+        self.gaps = 0
+        self.missed_motions = 0
+        self.reboots = 0
+        self.duplicates = 0
+        self.last_time = None
+        self.last_motion_time = None
+        self.period = 0.0 # ms between keepalives, exponentially weighted
+        self.intervals = [] # The first ones, until there is a period
+        self.loss = 0.0 # Recent fraction of frames lost, exponentially weighted
+
+    def update(self, sensor_time: int, motion_time: int):
+        last_time = self.last_time
+        self.last_time = sensor_time
+        if last_time is None:
+            self.frames += 1
+            self.last_motion_time = motion_time
+            return
+
+        interval = (sensor_time - last_time) & 0xffffffff # millis() wraps
+        if interval == 0 and motion_time == self.last_motion_time:
+            self.duplicates += 1
+            return
+        self.frames += 1
+        if interval >= 1 << 31:
+            self.reboots += 1
+            self.last_motion_time = motion_time
+            return
+
+        if motion_time != self.last_motion_time:
+            self.last_motion_time = motion_time
+            if (sensor_time - motion_time) & 0xffffffff > self.motion_delay:
+                self.missed_motions += 1
+
+        period = self.period
+        lost = 0
+        if self.intervals is not None:
+            # The median, motion frames make intervals short and gaps long
+            self.intervals.append(interval)
+            if len(self.intervals) == self.warmup:
+                self.period = max(sorted(self.intervals)[self.warmup // 2], 1)
+                self.intervals = None
+        elif interval > self.gap_factor * period:
+            lost = max(round(interval / period) - 1, 1)
+            self.lost += lost
+            self.gaps += 1
+        elif interval > .75 * period:
+            # Shorter ones follow a motion frame, the keepalive timer restarted
+            self.period += self.alpha * (interval - period)
+
+        # `lost` frames lost, then this one received
+        keep = 1 - self.alpha
+        if lost:
+            self.loss = 1 - (1 - self.loss) * keep ** lost
+        self.loss *= keep
+
+    def expected(self) -> int:
+        return self.frames + self.lost
+
+    def to_dict(self) -> dict:
+        return {"frames": self.frames, "lost": self.lost, "gaps": self.gaps,
+                "missed motions": self.missed_motions, "reboots": self.reboots,
+                "duplicates": self.duplicates, "period": round(self.period, 1),
+                "loss": round(self.loss, 4)}
@@ -2,52 +2,241 @@ from PyQt6.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
 import sys, traceback
 from worker import WorkerSignals
 
-from pythonosc import udp_client
-from pythonosc.osc_message_builder import OscMessageBuilder
+from pythonosc.osc_message_builder import BuildError, OscMessageBuilder
+from pythonosc.parsing import osc_types
 import queue
+import select
+import socket
+import struct
 import time
+from collections import deque
+from typing import Dict, List, Optional, Set
 from config import Config
+from governor import CueGovernor
+from latency import LatencyMonitor
 
 class OscClient(QRunnable):
+    """
+    Sends cues to all OSC destinations (Config.osc_destinations) from a single
+    thread, with one connected socket per destination. Each cue is encoded once
+    and only goes to the targets its tracker is routed to.
+    """
+    # Set to time the cues from the filter to the socket
+    latency_monitor : LatencyMonitor = None
+    recover = 10 # s without send errors before a failing target's next error is logged again
+
     def __init__(self, config: Config):
         super(OscClient, self).__init__()
-        self.ip = config.osc_ip
-        self.port = config.osc_port
+        self.targets = {t.name: (t.ip, t.port) for t in config.osc_destinations()}
         self.running = False
+        self.sockets : Dict[str, socket.socket] = {}
         self.signals = WorkerSignals()
         self.cues = queue.Queue()
+        self.latency = {name: deque(maxlen=100) for name in self.targets}
+        self.dropped = {name: 0 for name in self.targets} # Cues a send error lost, per target
+        self.failing : Dict[str, float] = {} # Targets that failed: when they last did
+        self.datagrams : Dict[str, bytes] = {}
+        self.cue_targets : Dict[str, Set[str]] = {}
+        self.cue_priority : Dict[str, int] = {}
+        self.bad_cues : Set[str] = set() # Warned about once, never sent
+        self.compile_cues(config)
+        self.governor = CueGovernor(config.cue_rate, config.cue_burst, config.cue_overflow, config.cue_max_delay)
+        self.bundle_window = config.osc_bundle_window / 1000
 
     @pyqtSlot()
     def run(self):
         try:
             self.running = True
-            self.client = udp_client.SimpleUDPClient(self.ip, self.port)
-            print(f"Starting OSC client to {self.ip}:{self.port}")
+            self.open()
 
             while(self.running):
                 try:
-                    cue_name = self.cues.get(True, .5)
-                    self.client.send_message(cue_name, 1)
-                    # print(f"Sent cue {cue_name} to {self.ip}:{self.port}")
+                    item = self.cues.get(True, self.governor.wait_time())
                 except queue.Empty:
-                    continue
+                    item = () # Time to release a deferred cue
+                if item is None: # Woken up by stop()
+                    break
+                if not item:
+                    items = []
+                elif self.bundle_window > 0:
+                    items = self.collect(item)
+                else:
+                    items = [item]
+                self.dispatch(items)
 
         except:
             traceback.print_exc()
             exctype, value = sys.exc_info()[:2]
             self.signals.error.emit((exctype, value, traceback.format_exc()))
         finally:
+            self.close()
             try:
                 self.signals.finished.emit()
             except RuntimeError:
                 print("OscClient not sending finished signal - quitting")
 
-    def send_cue(self, cue: str):
-        self.cues.put(cue)
+    def open(self):
+        for name, address in self.targets.items():
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.connect(address)
+            self.sockets[name] = sock
+            print(f"Starting OSC client to {name} at {address[0]}:{address[1]}")
+
+    def close(self):
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets = {}
+
+    def dispatch(self, items: list[tuple]):
+        """Send (cue, host_time, trace) items the governor lets through to their targets"""
+        if self.bad_cues:
+            items = [i for i in items if self.datagram(i[0]) is not None]
+        items = self.governor.admit(items, [self.cue_priority.get(cue, 0) for cue, *_ in items])
+        monitor = self.latency_monitor
+        for name, sock in self.sockets.items():
+            routed = [i for i in items if name in self.cue_targets.get(i[0], self.targets)]
+            if not routed:
+                continue
+            if monitor:
+                dispatched = monitor.now()
+            if not self.send(name, sock, self.bundle(routed)):
+                # One target failing doesn't stop the others
+                self.dropped[name] += len(routed)
+                continue
+            if monitor:
+                sent = monitor.now()
+                for _, _, trace in routed:
+                    if trace is not None:
+                        monitor.sent(trace, dispatched, sent)
+            now = time.time()
+            self.latency[name].extend([(now - host_time) * 1000 for _, host_time, _ in routed if host_time is not None])
+        # print(f"Sent cues {items} to {self.targets}")
+
+    def send(self, name: str, sock: socket.socket, datagram: bytes) -> bool:
+        """
+        False when the datagram couldn't be sent. The error is logged once,
+        until sends to the target work for `recover` seconds.
+        """
+        try:
+            try:
+                sock.send(datagram)
+            except BlockingIOError:
+                # Socket buffer full, wait briefly for room rather than spin
+                select.select([], [sock], [], .01)
+                sock.send(datagram)
+        except ConnectionRefusedError:
+            # ICMP port unreachable from an earlier datagram, nobody listening (yet)
+            self.failed(name, "not listening")
+            return False
+        except OSError as e:
+            # E.g. host unreachable or still no room, only this target loses the cue
+            self.failed(name, f"failed: {e}")
+            return False
+        # A refusal only shows on the send after the one that caused it, so one send that
+        # went through doesn't mean the target is back
+        failed = self.failing.get(name)
+        if failed is not None and time.monotonic() - failed > self.recover:
+            del self.failing[name]
+        return True
+
+    def failed(self, name: str, message: str):
+        if name not in self.failing:
+            ip, port = self.targets[name]
+            print(f"OSC target {name} at {ip}:{port} {message}")
+        self.failing[name] = time.monotonic()
+
+    @staticmethod
+    def encode(cue: str) -> bytes:
+        builder = OscMessageBuilder(address=cue)
+        builder.add_arg(1)
+        return builder.build().dgram
+
+    def datagram(self, cue: str) -> Optional[bytes]:
+        """None for a cue that isn't an OSC address, like an emptied cue field"""
+        datagram = self.datagrams.get(cue)
+        if datagram is None and cue not in self.bad_cues:
+            try:
+                if not cue.startswith("/"):
+                    raise BuildError("OSC addresses start with /")
+                datagram = self.datagrams[cue] = self.encode(cue)
+            except BuildError as e:
+                print(f"Not sending cue {cue!r}: {e}")
+                self.bad_cues.add(cue)
+        return datagram
+
+    def compile_cues(self, config: Config):
+        """Pre-encode and route the cue of every tracker, call again when a cue changes"""
+        self.datagrams = {}
+        for tracker in config.trackers:
+            self.datagram(tracker.cue)
+        cue_targets = {}
+        for tracker in config.trackers:
+            if tracker.cue in self.bad_cues:
+                continue
+            targets = set(tracker.targets or self.targets)
+            unknown = targets.difference(self.targets)
+            if unknown:
+                print(f"Cue {tracker.cue} routed to unknown OSC target(s) {', '.join(unknown)}")
+            cue_targets.setdefault(tracker.cue, set()).update(targets)
+        self.cue_targets = cue_targets
+        self.cue_priority = {tracker.cue: tracker.priority for tracker in config.trackers}
+
+    def collect(self, first: tuple) -> list[tuple]:
+        """Gather the cues arriving within the bundle window after the first one"""
+        items = [first]
+        deadline = time.monotonic() + self.bundle_window
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                item = self.cues.get(True, remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self.running = False
+                break
+            items.append(item)
+        return items
+
+    def bundle(self, items: list[tuple]) -> bytes:
+        """
+        One datagram for all cues, or an OSC bundle in motion order, timetagged
+        with the host time of the first motion, when there are several
+        """
+        if len(items) == 1:
+            return self.datagram(items[0][0])
+        items = sorted(items, key=lambda item: item[1] or 0)
+        host_time = items[0][1]
+        dgram = b"#bundle\x00" + osc_types.write_date(host_time or osc_types.IMMEDIATELY)
+        for cue, *_ in items:
+            datagram = self.datagram(cue)
+            dgram += struct.pack(">i", len(datagram)) + datagram
+        return dgram
+
+    def send_cue(self, cue: str, host_time: float = None, trace: tuple = None):
+        """
+        Thread safe, host_time is when the motion that triggered the cue
+        happened (wall clock) and trace its LatencyMonitor timestamps, if any
+        """
+        if trace is not None:
+            trace += (LatencyMonitor.now(),)
+        self.cues.put((cue, host_time, trace))
+
+    def latency_ms(self) -> Dict[str, tuple[float, float]]:
+        """Average and maximum motion-to-OSC delay over the last cues, per target"""
+        result = {}
+        for name, latency in self.latency.items():
+            latency = list(latency)
+            result[name] = (sum(latency) / len(latency), max(latency)) if latency else (0, 0)
+        return result
 
     def update_config(self, config: Config, item: str):
+        if item == "osc_bundle_window":
+            self.bundle_window = config.osc_bundle_window / 1000
+        if item.startswith("cue_"):
+            self.governor.configure(config.cue_rate, config.cue_burst, config.cue_overflow, config.cue_max_delay)
         if not item in ["osc_ip", "osc_port"]:
             return
 
     def stop(self):
         self.running = False
+        self.cues.put(None)
@@ -1,27 +1,49 @@
 import struct
 from random import random
 from time import time
+from typing import Iterator, List
 
 class Packet():
     now = time()
     motion_keys =  ["z_pos", "z_neg", "y_pos", "y_neg", "x_pos", "x_neg"]
     motion_keys_short =  ["Z", "z", "Y", "y", "X", "x"]
+    motion_shift = 2 # Axis bits start at bit 2 of packet_t.motion
     format = '<HBLLhhhBBBBB'
     size = struct.calcsize(format)
 
+    __slots__ = ("host_time", "id", "cfg_update", "threshold", "duration",
+                 "sensor_time", "motion_bits", "motion_time", "acc")
+
     def __init__(self, id:int, sensor_time:int,
                  cfg_update: bool, threshold: int, duration: int,
-                 motion: list[bool], motion_time: int, acc:tuple[float, float, float]):
+                 motion: int, motion_time: int, acc:tuple[float, float, float]):
+        """`motion` is the raw packet_t.motion bitmask, see motion_mask()"""
         self.host_time = time()
         self.id = id
         self.cfg_update = cfg_update
         self.threshold = threshold
         self.duration = duration
         self.sensor_time = sensor_time
-        self.motion = motion
+        self.motion_bits = motion
         self.motion_time = motion_time
         self.acc = acc
 
+    @property
+    def motion(self) -> list[bool]:
+        return self.motion_list(self.motion_bits)
+
+    def has_motion(self, axis: int) -> bool:
+        return self.motion_bits & (1 << (axis + self.motion_shift)) != 0
+
+    @classmethod
+    def motion_mask(cls, axes: list[bool]) -> int:
+        """Bitmask with the bits of the enabled axes (in motion_keys order) set"""
+        return sum(1 << (i + cls.motion_shift) for i, v in enumerate(axes) if v)
+
+    @classmethod
+    def motion_list(cls, bits: int) -> list[bool]:
+        return [bits & (1 << (i + cls.motion_shift)) != 0 for i in range(len(cls.motion_keys))]
+
     def __repr__(self) -> str:
         motion_str = "".join([self.motion_keys_short[i] if v else " " for i, v in enumerate(self.motion)])
 
@@ -36,12 +58,8 @@ class Packet():
     def from_bytes(cls, buf) -> "Packet":
         if len(buf) != Packet.size:
             return None
-        (magic, id, sensor_time,
-            time_last_motion,
-            acc_x, acc_y, acc_z,
-            motion_status,
-            cfg_update, cfg_threshold, cfg_duration,
-            checksum_exp) = struct.unpack(Packet.format, buf)
+        fields = struct.unpack(Packet.format, buf)
+        magic, checksum_exp = fields[0], fields[-1]
 
         if magic != 0xE1BA:
             print(f"Unexpected magic {magic:04X}")
@@ -52,19 +70,174 @@ class Packet():
             print(f"Unexpected checksum {checksum:02X} != {checksum_exp:02X}")
             return None
 
-        return cls(id, sensor_time,
-                   cfg_update, cfg_threshold, cfg_duration,
-                    [(motion_status & (1 << i) != 0) for i in range(8)][2:],
-                    time_last_motion,
-                    (acc_x, acc_y, acc_z))
+        return cls.from_fields(fields)
+
+    @classmethod
+    def from_fields(cls, fields: tuple) -> "Packet":
+        # (magic, id, sensor_time, time_last_motion, acc_x, acc_y, acc_z,
+        #  motion_status, cfg_update, cfg_threshold, cfg_duration, checksum)
+        return cls(fields[1], fields[2],
+                   fields[8], fields[9], fields[10],
+                   fields[7],
+                   fields[3],
+                   fields[4:7])
+
+    def bytes(self) -> bytes:
+        payload = bytearray(struct.pack(Packet.format, 0xE1BA, self.id,
+                                        int(self.sensor_time) & 0xffffffff,
+                                        int(self.motion_time) & 0xffffffff,
+                                        *[int(v) for v in self.acc],
+                                        self.motion_bits,
+                                        int(self.cfg_update), self.threshold, self.duration,
+                                        0))
+        payload[-1] = sum(payload[2:-1]) & 0xff
+        return bytes(payload)
 
     @classmethod
     def random(cls, id, ranges) -> "Packet":
         return cls(id,
                    time() - cls.now,
-                   False, 0, 0, [], -1, tuple([random() * i for i in ranges]))
+                   False, 0, 0, 0, -1, tuple([random() * i for i in ranges]))
+
+class FrameDecoder():
+    """
+    Streaming decoder for the receiver's serial stream.
+
+    Bytes are read straight into a preallocated buffer; every call to decode()
+    validates all complete frames in one go (magic + checksum over a 2D view of
+    the buffer) and unpacks the valid run with struct.iter_unpack.
+
+    The decoder is either synced (a frame is expected at the start of the
+    buffer) or hunting. Garbage and corrupt frames never raise: the decoder
+    slides to the next magic in the buffered data and counts what it skipped.
+    """
+    magic = bytes([0xBA, 0xE1])
+    batch_min = 8
+
+    def __init__(self, capacity: int = 256 * Packet.size):
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+        self.synced = False
+        self.dropped_bytes = 0
+        self.corrupt_frames = 0
+        self.resyncs = 0
+        self.sync_dropped = 0
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def space(self, count: int) -> memoryview:
+        """Writable view of at least `count` free bytes at the end of the buffer"""
+        if self.end + count > len(self.buffer):
+            pending = self.end - self.start
+            self.buffer[:pending] = bytes(self.view[self.start:self.end])
+            if pending + count > len(self.buffer):
+                self.view.release()
+                self.buffer.extend(bytes(pending + count - len(self.buffer)))
+                self.view = memoryview(self.buffer)
+            self.start, self.end = 0, pending
+        return self.view[self.end:self.end + count]
+
+    def readinto(self, port) -> int:
+        """Read whatever the port has waiting (blocking for at least one byte)"""
+        count = max(port.in_waiting, 1)
+        n = port.readinto(self.space(count)) or 0
+        self.end += n
+        return n
+
+    def feed(self, data) -> None:
+        n = len(data)
+        self.space(n)[:] = data
+        self.end += n
+
+    def decode(self, raw: list = None) -> List[Packet]:
+        """With `raw` given, the bytes of the decoded frames are appended to it as well"""
+        packets = []
+        for run in self.runs():
+            if raw is not None:
+                raw.append(bytes(run))
+            packets.extend(map(Packet.from_fields, struct.iter_unpack(Packet.format, run)))
+        return packets
+
+    def decode_batch(self) -> "PacketBatch":
+        """Like decode(), but columnar for bulk paths"""
+        from batch import PacketBatch
+        return PacketBatch.concatenate([PacketBatch.from_buffer(run) for run in self.runs()])
+
+    def runs(self) -> Iterator[memoryview]:
+        """
+        Yields views on runs of consecutive valid frames. A view is only valid
+        until the next one is requested.
+        """
+        size = Packet.size
+        while self.end - self.start >= size:
+            start = self.buffer.find(self.magic, self.start, self.end)
+            if start < 0:
+                # Keep a trailing 0xBA, it might be the first half of the magic
+                start = self.end - 1 if self.buffer[self.end - 1] == self.magic[0] else self.end
+            if start != self.start:
+                self.lose_sync()
+                self.dropped_bytes += start - self.start
+                self.start = start
+
+            count = (self.end - start) // size
+            if count == 0:
+                break
+
+            n_valid = self.validate(start, count)
+
+            if n_valid:
+                end = start + n_valid * size
+                self.start = end
+                if not self.synced:
+                    self.synced = True
+                    if self.resyncs == 0:
+                        # Later ones only show up in stats(), a noisy link would flood the output
+                        print(f"Sync done after dropping {self.dropped_bytes - self.sync_dropped} byte(s)")
+                yield self.view[start:end]
+            else:
+                # Slide past this magic, the next one is searched for in the buffered data
+                self.lose_sync()
+                self.corrupt_frames += 1
+                self.dropped_bytes += 1
+                self.start = start + 1
+
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def lose_sync(self):
+        if self.synced:
+            self.synced = False
+            self.resyncs += 1
+            self.sync_dropped = self.dropped_bytes
+
+    def stats(self) -> dict:
+        return {"dropped": self.dropped_bytes, "corrupt": self.corrupt_frames, "resyncs": self.resyncs}
+
+    def validate(self, start: int, count: int) -> int:
+        """Number of consecutive valid frames from `start`"""
+        size = Packet.size
+        if count < self.batch_min:
+            # Not worth setting up the array for a handful of frames
+            buf = self.buffer
+            for i in range(count):
+                s = start + i * size
+                if buf[s] != 0xBA or buf[s + 1] != 0xE1 or sum(buf[s + 2:s + size - 1]) & 0xff != buf[s + size - 1]:
+                    return i
+            return count
+
+        import numpy as np # Loaded on first use, it's the bulk of the startup import time
+        frames = np.frombuffer(self.view[start:start + count * size], dtype=np.uint8).reshape(count, size)
+        valid = (frames[:, 0] == 0xBA) & (frames[:, 1] == 0xE1) & \
+                (frames[:, 2:-1].sum(axis=1, dtype=np.uint8) == frames[:, -1])
+        return count if valid.all() else int(valid.argmin())
 
 class Config():
+    size = 6 # magic, channel, threshold, duration, checksum
+
     def __init__(self, channel: int, threshold: int, duration: int):
         self.channel = channel & 0xff
         self.threshold = threshold & 0xff
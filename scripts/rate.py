@@ -1,5 +1,6 @@
-from time import time
+from time import time, monotonic_ns
 from collections import deque
+from math import sqrt
 
 class RateCounter:
     def __init__(self, count):
@@ -19,4 +20,51 @@ class RateCounter:
     def __call__(self) -> float:
         if len(self.timestamps) < 2:
             return 0
-        return (len(self.timestamps) - 1) / (self.timestamps[-1] - self.timestamps[0])
\ No newline at end of file
+        return (len(self.timestamps) - 1) / (self.timestamps[-1] - self.timestamps[0])
+
+class EwmaRateCounter:
+    """
+    Drop-in alternative for RateCounter in constant time and memory.
+
+    Keeps an exponentially weighted mean and variance of the inter-arrival
+    time on the monotonic clock, so wall-clock jumps don't distort it. The
+    variance gives the jitter, which is what points at a flaky radio link.
+    """
+    __slots__ = ("alpha", "last", "interval", "variance", "count")
+
+    def __init__(self, count):
+        # Same centre of mass as a moving window of `count` events
+        self.alpha = 2 / (count + 1)
+        self.reset()
+
+    def event(self):
+        now = monotonic_ns()
+        if self.count == 1:
+            self.interval = now - self.last
+        elif self.count > 1:
+            diff = (now - self.last) - self.interval
+            increment = self.alpha * diff
+            self.interval += increment
+            self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+        self.last = now
+        self.count += 1
+
+    def reset(self):
+        self.last = 0
+        self.interval = 0.0
+        self.variance = 0.0
+        self.count = 0
+
+    def older_than(self, time_ms):
+        if self.count == 0:
+            return True
+        return (monotonic_ns() - self.last) > time_ms * 1e6
+
+    def jitter(self) -> float:
+        """Standard deviation of the inter-arrival time in ms"""
+        return sqrt(self.variance) / 1e6
+
+    def __call__(self) -> float:
+        if self.count < 2 or self.interval <= 0:
+            return 0
+        return 1e9 / self.interval
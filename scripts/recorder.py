@@ -0,0 +1,114 @@
+import mmap
+import struct
+from pathlib import Path
+from time import monotonic_ns, sleep
+from typing import Iterator, Tuple
+
+class SessionRecorder():
+    """
+    Append-only log of the raw serial stream.
+
+    The file starts with `header`, followed by one record per read from the
+    port: the monotonic host time in ns and the byte count (`record`), then
+    the bytes themselves, framed or not.
+    """
+    header = b"JETSEREC\x01\x00\x00\x00"
+    record = struct.Struct("<QI")
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        new = not self.path.exists() or self.path.stat().st_size == 0
+        self.file = open(self.path, "ab")
+        if new:
+            self.file.write(self.header)
+        print(f"Recording serial stream to {self.path.resolve()}")
+
+    def write(self, data, time_ns: int = None):
+        self.file.write(self.record.pack(monotonic_ns() if time_ns is None else time_ns, len(data)))
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+class SessionReplay():
+    """Memory-mapped reader for a SessionRecorder log"""
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if self.view[:len(SessionRecorder.header)] != SessionRecorder.header:
+            raise ValueError(f"{self.path} is not a session recording")
+
+    def records(self) -> Iterator[Tuple[int, memoryview]]:
+        """(host time in ns, bytes) for every read in the recording"""
+        record = SessionRecorder.record
+        pos = len(SessionRecorder.header)
+        while pos + record.size <= len(self.view):
+            time_ns, length = record.unpack_from(self.view, pos)
+            pos += record.size
+            if pos + length > len(self.view):
+                print(f"Recording {self.path} truncated, stopping replay")
+                return
+            yield time_ns, self.view[pos:pos + length]
+            pos += length
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+class ReplayPort():
+    """
+    Plays a recording back with the subset of the serial.Serial API that
+    SensorInterface uses. `speed` scales the recorded timing, 0 replays as
+    fast as possible. Raises EOFError once the recording is done.
+    """
+    def __init__(self, path: str, speed: float = 1.0):
+        self.replay = SessionReplay(path)
+        self.records = self.replay.records()
+        self.speed = speed
+        self.pending = memoryview(b"")
+        self.offset_ns = None
+        self.cancelled = False
+
+    def next_record(self):
+        time_ns, data = next(self.records, (None, None))
+        if data is None:
+            raise EOFError(f"End of recording {self.replay.path}")
+
+        if self.speed > 0:
+            now = monotonic_ns()
+            if self.offset_ns is None:
+                self.offset_ns = now - time_ns / self.speed
+            delay = (self.offset_ns + time_ns / self.speed - now) / 1e9
+            if delay > 0 and not self.cancelled:
+                sleep(delay)
+        self.pending = data
+
+    @property
+    def in_waiting(self) -> int:
+        if len(self.pending) == 0:
+            self.next_record()
+        return len(self.pending)
+
+    def readinto(self, b) -> int:
+        if self.cancelled:
+            return 0
+        if len(self.pending) == 0:
+            self.next_record()
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def write(self, data):
+        # Nothing listens for config on a recording
+        return len(data)
+
+    def cancel_read(self):
+        self.cancelled = True
+
+    def close(self):
+        self.pending.release()
+        self.records.close()
+        self.replay.close()
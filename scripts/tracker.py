@@ -5,13 +5,15 @@ from PyQt6.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot, QTimer, Qt
 from PyQt6.QtGui import QPalette
 
 import time
+import heapq
 from config import Config, TrackerConfig
 from rate import RateCounter
 from typing import List
 from math import inf
 from rate import RateCounter
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from packet import Packet, Config
+from engine import ChannelState, FilterEngine, TrackerFilter
 
 
 class Columns:
@@ -28,17 +30,90 @@ class Columns:
     CUE         = 15
 
 FLASH_TIMEOUT = 200
+
+class FlashScheduler(QObject):
+    """
+    Flashes widgets red for a fixed time.
+
+    One timer serves all widgets: deadlines go on a heap and every timeout
+    restores all expired widgets in one batch. The colour is switched with the
+    `flash` dynamic property, matched by `stylesheet` on a parent widget, so
+    no stylesheet is rebuilt or parsed per flash.
+    """
+    stylesheet = '*[flash="true"] { background-color: red; }'
+
+    def __init__(self, timeout: int):
+        super(FlashScheduler, self).__init__()
+        self.timeout = timeout / 1000
+        self.deadlines : Dict[QWidget, float] = {}
+        self.heap : List[Tuple[float, int, QWidget]] = []
+        self.count = 0
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.expire)
+
+    def flash(self, widget: QWidget):
+        deadline = time.monotonic() + self.timeout
+        if widget not in self.deadlines:
+            self.set_flash(widget, True)
+        self.deadlines[widget] = deadline
+        # Re-flashing leaves the old entry on the heap, expire() skips it
+        self.count += 1
+        heapq.heappush(self.heap, (deadline, self.count, widget))
+        if not self.timer.isActive():
+            self.timer.start(int(self.timeout * 1000))
+
+    def expire(self):
+        now = time.monotonic()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, _, widget = heapq.heappop(self.heap)
+            if self.deadlines.get(widget) == deadline:
+                del self.deadlines[widget]
+                self.set_flash(widget, False)
+        if self.heap:
+            self.timer.start(max(1, int((self.heap[0][0] - now) * 1000) + 1))
+
+    @staticmethod
+    def set_flash(widget: QWidget, state: bool):
+        widget.setProperty("flash", state)
+        widget.style().unpolish(widget)
+        widget.style().polish(widget)
+
+
+def set_quietly(widget: QWidget, value):
+    """Set a table widget's value without it reporting a change"""
+    widget.blockSignals(True)
+    if isinstance(widget, QCheckBox):
+        widget.setChecked(value)
+    elif isinstance(widget, QLineEdit):
+        widget.setText(value)
+    else:
+        widget.setValue(value)
+    widget.blockSignals(False)
+
+
 class TrackerTable(QTableWidget):
     update_config = pyqtSignal(Config) # Channel ID, Config
     config_changed = pyqtSignal()
+    cues_changed = pyqtSignal()
 
     #               0         1           2       3       4       5                                   12       13           14       15
     columns = ["tracker", "channel", "threshold", "", "duration", ""] + Packet.motion_keys_short + ["rate", "rpt same", "rpt diff", "cue"]
 
     n_trackers = 0
 
-    def __init__(self, config: Config):
+    stylesheet = '''
+        QLabel[rate="ok"]    { background-color: #b6ef8e; }
+        QLabel[rate="lossy"] { background-color: #efb35c; }
+        QLabel[rate="stale"] { background-color: #efd042; }
+        QLabel[rate="dead"]  { background-color: #ef8e8e; }
+        QSpinBox[sync="pending"] { background-color: #efd042; }
+        QSpinBox[sync="failed"]  { background-color: #ef8e8e; }
+    '''
+
+    def __init__(self, config: Config, engine: FilterEngine):
         self.config = config
+        self.engine = engine
         super().__init__(len(self.config.trackers)*2, len(TrackerTable.columns))
         self.setHorizontalHeaderLabels(TrackerTable.columns)
 
@@ -47,16 +122,13 @@ class TrackerTable(QTableWidget):
         self.duration_sliders   = {}
         self.duration_spinners  = {}
 
-        self.filters = []
-        self.rates = {}
         for i, tracker in enumerate(config.trackers):
             self.addTracker(i, tracker)
             self.setSpan(i * 2, Columns.INDEX, 2, 1)
             self.setSpan(i * 2, Columns.REPEAT_SAME, 2, 1)
             self.setSpan(i * 2, Columns.REPEAT_DIFF, 2, 1)
             self.setSpan(i * 2, Columns.CUE, 2, 1)
-            tracker_filter = TrackerFilter(tracker)
-            self.filters.append(tracker_filter)
+        for tracker_filter in self.engine.filters:
             tracker_filter.cue.connect(self.handle_cue)
 
         self.resizeRowsToContents()
@@ -67,8 +139,11 @@ class TrackerTable(QTableWidget):
         header.setSectionResizeMode(Columns.DUR_SLIDER, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(Columns.RATE, QHeaderView.ResizeMode.Stretch)
 
-        self.packets = {}
-        self.flash_timers : Dict[QWidget, QTimer] = {}
+        self.flasher = FlashScheduler(FLASH_TIMEOUT)
+        self.rate_cells : Dict[int, Tuple[str, str, str]] = {}
+        self.rate_shown : Dict[int, Tuple[int, int]] = {} # Rate in Hz and loss in % as shown
+        self.sync_cells : Dict[int, str] = {}
+        self.setStyleSheet(self.stylesheet + FlashScheduler.stylesheet)
 
     def table_value_changed(self, arg):
         for row in range(self.rowCount()):
@@ -89,8 +164,8 @@ class TrackerTable(QTableWidget):
             case Columns.CH:
                 # print(f"Channel changed for tracker {tracker_id} -> {arg}")
                 tracker.channels[offset] = arg
+                self.engine.rebuild_routes()
                 self.update_config.emit(Config(tracker.channels[offset], tracker.threshold[offset], tracker.duration[offset]))
-                self.rates[row].reset()
 
             case Columns.THR_SLIDER:
                 # print(f"Threshold slider changed for tracker {tracker_id} -> {arg}")
@@ -130,7 +205,11 @@ class TrackerTable(QTableWidget):
 
             case Columns.CUE:
                 # print(f"Cue changed for tracker {tracker_id} -> {arg}")
+                if not TrackerConfig.valid["cue"](arg):
+                    # Half typed, the last OSC address stays in use and in the file
+                    return
                 tracker.cue = arg
+                self.cues_changed.emit()
 
         self.config_changed.emit()
 
@@ -200,7 +279,6 @@ class TrackerTable(QTableWidget):
             rate_label.setText("-- Hz")
             rate_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
             self.setCellWidget(row + i, Columns.RATE, rate_label)
-            self.rates[row+i] = RateCounter(5)
 
         # Repeat rate
         repeat_same_spin = QSpinBox()
@@ -222,18 +300,34 @@ class TrackerTable(QTableWidget):
         self.cue.textChanged.connect(self.table_value_changed)
         self.setCellWidget(row + i, Columns.CUE, self.cue)
 
-    def process(self, packet: Packet):
-        for filter in self.filters:
-            filter.process(packet)
-
-        for row in range(self.rowCount()):
-            if(self.cellWidget(row, 1).value() == packet.id):
-                self.updateRowChannelInfo(row, packet)
-
-    def updateRowChannelInfo(self, row: int, packet: Packet):
-        self.rates[row].event()
+    def update_tracker(self, idx: int):
+        """Show a tracker's config after it was changed outside the table, e.g. by a reload"""
+        tracker = self.config.trackers[idx]
+        row = idx * 2
+        for i in range(2):
+            values = {Columns.CH: tracker.channels[i],
+                      Columns.THR_SLIDER: tracker.threshold[i], Columns.THR_SPIN: tracker.threshold[i],
+                      Columns.DUR_SLIDER: tracker.duration[i], Columns.DUR_SPIN: tracker.duration[i]}
+            for j, enabled in enumerate(tracker.axes[i]):
+                values[Columns.AXES[j]] = enabled
+            for column, value in values.items():
+                set_quietly(self.cellWidget(row + i, column), value)
+        set_quietly(self.cellWidget(row + 1, Columns.REPEAT_SAME), tracker.repeat_same)
+        set_quietly(self.cellWidget(row + 1, Columns.REPEAT_DIFF), tracker.repeat_different)
+        set_quietly(self.cellWidget(row + 1, Columns.CUE), tracker.cue)
+
+    def refresh(self):
+        """Pull what changed since the last frame from the engine snapshot"""
+        for channel, state in self.engine.snapshot.take().items():
+            route = self.engine.routes.get(channel)
+            if route is None:
+                continue
+            _, offset, tracker_id = route
+            self.updateRowChannelInfo(tracker_id * 2 + offset, state)
 
-        if packet.cfg_update:
+    def updateRowChannelInfo(self, row: int, state: ChannelState):
+        packet = state.packet
+        if state.cfg_update:
             self.threshold_spinners[row].blockSignals(True)
             self.threshold_sliders[row].setValue(packet.threshold)
             self.threshold_sliders[row].setValue(packet.threshold)
@@ -244,105 +338,76 @@ class TrackerTable(QTableWidget):
             self.duration_spinners[row].setValue(packet.duration)
             self.duration_spinners[row].blockSignals(False)
 
-        last_packet = self.packets.get(packet.id, None)
-        if last_packet is None or packet.motion_time != last_packet.motion_time:
-            self.packets[packet.id] = packet
-            for axis, motion in enumerate(packet.motion):
-                if motion:
-                    self.flash(self.cellWidget(row, Columns.AXES[axis]))
+        for axis, motion in enumerate(Packet.motion_list(state.motion)):
+            if motion:
+                self.flash(self.cellWidget(row, Columns.AXES[axis]))
 
     def update_rates(self):
         for row in range(self.rowCount()):
-            rate = self.rates[row]
-            rate_widget : QLabel = self.cellWidget(row, Columns.RATE)
+            channel = self.config.trackers[row // 2].channels[row % 2]
+            rate = self.engine.snapshot.rate(channel)
+            last_state, text, tip = self.rate_cells.get(row, (None, "-- Hz", ""))
+            link = self.engine.links.get(channel)
+            jitter = None
             if rate.older_than(1000):
-                rate_widget.setStyleSheet("background-color: #ef8e8e")
-                rate_widget.setText(f"N/A")
+                state, text = "dead", "N/A"
                 rate.reset()
             elif rate.older_than(400):
-                rate_widget.setStyleSheet("background-color: #efd042")
+                state = "stale"
             else:
-                rate_widget.setStyleSheet("background-color: #b6ef8e")
-                rate_widget.setText(f"{rate():5.2f} Hz")
+                # Whole Hz and %, kept until the value is clearly off, so the cell
+                # doesn't flicker between two numbers
+                shown_rate, shown_loss = self.rate_shown.get(row, (-1, -1))
+                value, loss = rate(), link.loss * 100 if link else 0
+                if abs(value - shown_rate) > .75:
+                    shown_rate = round(value)
+                if abs(loss - shown_loss) > .75:
+                    shown_loss = round(loss)
+                self.rate_shown[row] = (shown_rate, shown_loss)
+                state, text = "ok", f"{shown_rate} Hz"
+                jitter = f"±{rate.jitter():.0f} ms jitter"
+                if loss >= .5:
+                    text += f" {shown_loss:3d}% lost"
+                    if loss >= 5:
+                        state = "lossy"
+            if link:
+                tip = (f"{link.lost} of {link.expected()} frames lost in {link.gaps} gaps, "
+                       f"{link.missed_motions} motion frames lost, {link.reboots} reboots, {link.duplicates} duplicates")
+            if jitter:
+                tip = f"{jitter}\n{tip}" if link else jitter
+
+            # Only touch the widget when what it shows changes
+            last = self.rate_cells.get(row)
+            if (state, text, tip) == last:
+                continue
+            self.rate_cells[row] = (state, text, tip)
+            rate_widget : QLabel = self.cellWidget(row, Columns.RATE)
+            if state != last_state:
+                rate_widget.setProperty("rate", state)
+                rate_widget.style().unpolish(rate_widget)
+                rate_widget.style().polish(rate_widget)
+            if last is None or text != last[1]:
+                rate_widget.setText(text)
+            if last is None or tip != last[2]:
+                rate_widget.setToolTip(tip)
+
+    def update_sync(self, status: Dict[int, str]):
+        """Mark channels whose transmitter hasn't confirmed its config yet"""
+        for row in range(self.rowCount()):
+            state = status.get(self.config.trackers[row // 2].channels[row % 2], "")
+            if state == self.sync_cells.get(row, ""):
+                continue
+            self.sync_cells[row] = state
+            channel_widget : QSpinBox = self.cellWidget(row, Columns.CH)
+            channel_widget.setProperty("sync", state)
+            channel_widget.setToolTip(f"config {state}" if state else "")
+            channel_widget.style().unpolish(channel_widget)
+            channel_widget.style().polish(channel_widget)
 
     def flash(self, widget: QWidget):
-        if widget in self.flash_timers.keys():
-            self.flash_timers[widget][0].stop()
-            stylesheet = self.flash_timers[widget][1]
-        else:
-            stylesheet = widget.styleSheet()
-
-        timer = QTimer()
-
-        timer.setInterval(FLASH_TIMEOUT)
-        timer.setSingleShot(True)
-        timer.timeout.connect(lambda: self.flash_restore(widget))
-        timer.start()
-        self.flash_timers[widget] = (timer, stylesheet)
-
-        widget.setStyleSheet(stylesheet + "background-color:red;")
-
-    def flash_restore(self, widget: QWidget):
-        widget.setStyleSheet(self.flash_timers[widget][1])
-        del self.flash_timers[widget]
+        self.flasher.flash(widget)
 
     def handle_cue(self, cue: str, sender: "TrackerFilter", offset: int):
-        row = self.filters.index(sender) * 2
+        row = self.engine.filters.index(sender) * 2
         label = self.cellWidget(row, Columns.INDEX)
         self.flash(label)
-
-    def interface_connected(self, connected: bool):
-        if not connected:
-            return
-
-        for tracker in self.config.trackers:
-            for i, ch in enumerate(tracker.channels):
-                cfg = Config(ch, tracker.threshold[i], tracker.duration[i])
-                print(f"Sending config to tracker of channel {ch} [{cfg}]")
-                self.update_config.emit(cfg)
-
-class TrackerFilter(QObject):
-    cue = pyqtSignal(str, object, int) # cue, filter, channel offset
-
-    def __init__(self, config: TrackerConfig):
-        super(TrackerFilter, self).__init__()
-        self.rate = RateCounter(100)
-        self.config = config
-
-        # self.update_config(config, "filter_")
-        self.last_motion_times = {}
-        self.cue_last_time = -1000
-        self.last_offset = -1
-
-        # self.timeout.connect(self.emit)
-        self.start_time = time.time()
-
-    def process(self, packet: Packet):
-        if packet.id not in self.config.channels:
-            return
-        offset = self.config.channels.index(packet.id)
-
-        packet_time = packet.host_time - self.start_time
-
-        if(packet.motion_time != self.last_motion_times.get(packet.id, 0)):
-            self.last_motion_times[packet.id] = packet.motion_time
-            interval = (packet.host_time - self.cue_last_time) * 1000
-            # print(f"Motion with interval {interval}")
-            for idx, enabled in enumerate(self.config.axes[offset]):
-                if enabled and packet.motion[idx]:
-                    if offset != self.last_offset and interval > self.config.repeat_different:
-                        # print("Sending cue for different foot")
-                        self.last_offset = offset
-                        self.cue_last_time = packet.host_time
-                        # print(f"Delay = {(time.time() - packet.host_time)*1000}")
-                        self.cue.emit(self.config.cue, self, offset)
-                        return
-                    elif offset == self.last_offset and interval > self.config.repeat_same:
-                        # print("Sending cue for same foot")
-                        # print(f"Delay = {(time.time() - packet.host_time)*1000}")
-                        self.cue_last_time = packet.host_time
-                        self.cue.emit(self.config.cue, self, offset)
-                        return
-                    else:
-                        # print("Not sending cue, too fast repeat")
-                        return # One packet can only cause 1 que
\ No newline at end of file
@@ -0,0 +1,149 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import pyqtSlot, pyqtSignal, QTimer, QSize
+
+from config_form import ConfigForm
+from tracker import TrackerTable
+from headless import Pipeline
+
+class MainWindow(QMainWindow):
+    def __init__(self, pipeline: Pipeline, config_path: str):
+        """Viewer and editor for a Pipeline, which keeps running without it in --headless mode"""
+        self.pipeline = pipeline
+        self.config = pipeline.config
+        self.engine = pipeline.engine
+        self.config_dirty = False
+
+        super().__init__()
+
+        self.setWindowTitle("Footstep tracker")
+
+        layout = QVBoxLayout()
+
+        # Config
+        self.config_widget = ConfigForm(self.config, config_path, pipeline.port)
+        self.config_widget.serial_connect.connect(self.serial_connect)
+        pipeline.serial_connected.connect(self.config_widget.serial_connected)
+        self.config_widget.osc_connect.connect(pipeline.osc_connect)
+        pipeline.osc_connected.connect(self.config_widget.osc_connected)
+        self.config_widget.config_changed.connect(self.config_changed)
+        self.config_widget.config_changed.connect(pipeline.config_changed)
+        self.config_widget.config_saved.connect(self.config_saved)
+        self.config_widget.ports_listed.connect(self.ports_listed)
+        if pipeline.replay:
+            self.config_widget.btn_connect_serial.setEnabled(True)
+        self.autostart = self.config.autostart
+
+        # Tracker table
+        self.trackers = self.build_trackers()
+        pipeline.config_reloaded.connect(self.config_widget.config_reloaded)
+        pipeline.config_reloaded.connect(self.config_reloaded)
+        pipeline.trackers_reloaded.connect(self.trackers_reloaded)
+        layout.addWidget(self.config_widget)
+        layout.addWidget(self.trackers)
+
+        # Initialization
+        container = QWidget()
+        container.setLayout(layout)
+
+        self.setCentralWidget(container)
+        self.statusBar()
+
+        self.timer_status = QTimer()
+        self.timer_status.setInterval(100)
+        self.timer_status.timeout.connect(self.update_status)
+        self.timer_status.timeout.connect(lambda: self.trackers.update_rates())
+        self.timer_status.timeout.connect(lambda: self.trackers.update_sync(self.pipeline.sync_status()))
+        self.timer_status.start()
+        self.destroyed.connect(self.timer_status.stop)
+
+        # Table updates are pulled from the engine snapshot at a fixed frame rate
+        self.timer_frame = QTimer()
+        self.timer_frame.setInterval(int(1000 / self.config.gui_fps))
+        self.timer_frame.timeout.connect(lambda: self.trackers.refresh())
+        self.timer_frame.start()
+        self.destroyed.connect(self.timer_frame.stop)
+
+        self.timer_autosave = QTimer()
+        self.timer_autosave.setSingleShot(True)
+        self.timer_autosave.timeout.connect(self.autosave)
+        self.destroyed.connect(self.timer_autosave.stop)
+
+    def build_trackers(self) -> TrackerTable:
+        trackers = TrackerTable(self.config, self.engine)
+        trackers.config_changed.connect(self.config_changed)
+        trackers.update_config.connect(self.pipeline.update_tracker_config)
+        trackers.cues_changed.connect(self.pipeline.compile_cues)
+        return trackers
+
+    def config_reloaded(self, keys: list, trackers: list):
+        for i in trackers:
+            if i < min(len(self.config.trackers), self.trackers.rowCount() // 2):
+                self.trackers.update_tracker(i)
+
+    def trackers_reloaded(self):
+        # Trackers were added or removed, rows and filters no longer line up
+        trackers = self.build_trackers()
+        self.centralWidget().layout().replaceWidget(self.trackers, trackers)
+        self.trackers.deleteLater()
+        self.trackers = trackers
+
+    @property
+    def interface(self):
+        return self.pipeline.interface
+
+    @property
+    def osc_client(self):
+        return self.pipeline.osc_client
+
+    def ports_listed(self):
+        # Ports are listed in the background, auto-start once the first list is in
+        if self.pipeline.replay:
+            self.config_widget.btn_connect_serial.setEnabled(True)
+        if self.autostart:
+            self.autostart = False
+            self.config_widget.btn_connect_serial.click()
+
+    def update_status(self):
+        self.statusBar().showMessage(self.pipeline.status())
+
+    def serial_connect(self, port):
+        if not port and not self.pipeline.replay:
+            self.statusBar().showMessage("no interface selected")
+        self.pipeline.serial_connect(port)
+
+    def osc_connect(self):
+        self.pipeline.osc_connect()
+
+    def config_changed(self):
+        self.config_dirty = True
+        # Debounced, a burst of edits is written once
+        if self.config.autosave > 0:
+            self.timer_autosave.start(self.config.autosave)
+        else:
+            self.timer_autosave.stop()
+
+    def autosave(self):
+        if self.config_dirty:
+            print(f"Autosaving config to {self.config_widget.config_path}")
+            self.config_widget.save_clicked()
+
+    def config_saved(self):
+        self.config_dirty = False
+        self.pipeline.config_saved()
+
+    def closeEvent(self,event):
+        if self.config_dirty:
+            result = QMessageBox.question(self,
+                        "Save config?",
+                        f"Config changed. Save to file {self.config_widget.config_path}?",
+                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if result == QMessageBox.StandardButton.Yes:
+                self.config_widget.save_clicked()
+
+        self.config_widget.closing = True
+        self.pipeline.stop()
+        self.pipeline.close()
+        event.accept()
+
+    def sizeHint(self):
+        return QSize(1100, 700)